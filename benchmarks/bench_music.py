@@ -0,0 +1,439 @@
+"""Offline load test for the music cog.
+
+Runs the real bot, `CogOld` and wavelink against `FakeLavalink`, with simulated
+guilds standing in for Discord. Commands go through `Bot.get_context` and
+`Bot.invoke`, so parsing, checks and the cog hooks are all part of the timings.
+
+    python benchmarks/bench_music.py --guilds 50 --commands 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "py_files"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import discord
+from discord.ext import commands
+import wavelink
+from handlers import bot_handler
+from players import deep_sizeof
+import metrics
+from fake_lavalink import FakeLavalink
+
+BOT_ID = 1000
+WORKLOAD = {"play": 0.45, "queue": 0.25, "skip": 0.15, "clear": 0.15}
+
+
+class BenchMessage:
+    """The parts of `discord.Message` the cog and command parsing touch."""
+
+    _next_id = 1
+
+    def __init__(self, content: str, author, channel, guild=None) -> None:
+        self.id = BenchMessage._next_id
+        BenchMessage._next_id += 1
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+        self.attachments = []
+        self.reactions = []
+        self._state = channel.bot._connection
+
+    async def edit(self, *, content: str | None = None, **kwargs) -> "BenchMessage":
+        self.channel.edits += 1
+        if content is not None:
+            self.content = content
+        return self
+
+    async def add_reaction(self, emoji: str) -> None:
+        self.reactions.append(emoji)
+
+    async def reply(self, content: str | None = None, **kwargs) -> "BenchMessage":
+        return await self.channel.send(content, reference=self, **kwargs)
+
+
+class BenchTextChannel:
+    def __init__(self, channel_id: int, name: str, bot: commands.Bot) -> None:
+        self.id = channel_id
+        self.name = name
+        self.mention = f"<#{channel_id}>"
+        self.bot = bot
+        self.sent = 0
+        self.edits = 0
+
+    async def send(self, content: str | None = None, **kwargs) -> BenchMessage:
+        self.sent += 1
+        return BenchMessage(content or "", self.bot.user, self)
+
+
+class BenchContext(commands.Context):
+    async def send(self, content: str | None = None, **kwargs) -> BenchMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class BenchGateway:
+    """Answers voice state changes the way the Discord gateway would."""
+
+    open = False
+    latency = 0.0
+
+    def __init__(self, bot: commands.Bot) -> None:
+        self.bot = bot
+
+    async def voice_state(
+        self,
+        guild_id: int,
+        channel_id: int | None,
+        self_mute: bool = False,
+        self_deaf: bool = False,
+    ) -> None:
+        state = self.bot._connection
+        state.parse_voice_state_update(
+            voice_state_payload(guild_id, channel_id, BOT_ID, self_deaf=self_deaf)
+        )
+        if channel_id:
+            state.parse_voice_server_update(
+                {"guild_id": str(guild_id), "token": "bench", "endpoint": "bench.invalid"}
+            )
+
+
+def user_payload(user_id: int, name: str, bot: bool = False) -> dict:
+    return {
+        "id": str(user_id),
+        "username": name,
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member_payload(user: dict) -> dict:
+    return {"user": user, "roles": [], "joined_at": None, "flags": 0}
+
+
+def voice_state_payload(
+    guild_id: int, channel_id: int | None, user_id: int, self_deaf: bool = False
+) -> dict:
+    return {
+        "guild_id": str(guild_id),
+        "channel_id": str(channel_id) if channel_id else None,
+        "user_id": str(user_id),
+        "session_id": "bench",
+        "deaf": False,
+        "mute": False,
+        "self_deaf": self_deaf,
+        "self_mute": False,
+        "self_video": False,
+        "suppress": False,
+        "request_to_speak_timestamp": None,
+    }
+
+
+class SimulatedGuild:
+    def __init__(self, bot: commands.Bot, index: int, listeners: int) -> None:
+        self.id = 10_000 + index
+        voice_id = self.id * 10 + 1
+        member_ids = [self.id * 100 + offset for offset in range(listeners)]
+
+        members = [member_payload(user_payload(BOT_ID, "djissu", bot=True))] + [
+            member_payload(user_payload(member_id, f"listener-{member_id}"))
+            for member_id in member_ids
+        ]
+        self.guild = discord.Guild(
+            state=bot._connection,
+            data={
+                "id": str(self.id),
+                "name": f"Guild {index}",
+                "owner_id": str(member_ids[0]),
+                "member_count": len(members),
+                "channels": [
+                    {
+                        "id": str(voice_id),
+                        "type": 2,
+                        "name": "Music",
+                        "position": 0,
+                        "bitrate": 64000,
+                        "user_limit": 0,
+                        "permission_overwrites": [],
+                    }
+                ],
+                "members": members,
+                "voice_states": [
+                    voice_state_payload(self.id, voice_id, member_id)
+                    for member_id in member_ids
+                ],
+                "roles": [],
+                "emojis": [],
+                "stickers": [],
+                "features": [],
+            },
+        )
+        bot._connection._add_guild(self.guild)
+
+        self.text_channel = BenchTextChannel(self.id * 10 + 2, "music", bot)
+        self.listeners = [self.guild.get_member(member_id) for member_id in member_ids]
+
+
+class Results:
+    def __init__(self) -> None:
+        self.timings: dict[str, list[float]] = {name: [] for name in WORKLOAD}
+        self.errors: dict[str, int] = {}
+
+    def record(self, command: str, seconds: float) -> None:
+        self.timings[command].append(seconds)
+
+    async def on_command_error(self, ctx, error) -> None:
+        name = type(getattr(error, "original", error)).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def pick_command(rng: random.Random, args) -> str:
+    command = rng.choices(list(WORKLOAD), weights=list(WORKLOAD.values()))[0]
+
+    if command == "play":
+        if rng.random() < args.playlist_ratio:
+            return f"play https://example.com/playlist?list={rng.randrange(args.popular)}"
+        # Popular queries follow a rough Zipf curve, like real request traffic.
+        rank = min(int(rng.paretovariate(1.2)), args.popular)
+        return f"play popular song {rank}"
+    elif command == "queue":
+        return f"queue {rng.randint(1, 3)}"
+    elif command == "clear":
+        entry = rng.choices(["end", "start", "1", "2", "5", "all"], weights=[5, 5, 4, 3, 2, 1])[0]
+        return f"clear {entry}"
+    return command
+
+
+async def run_guild(
+    bot: commands.Bot,
+    guild: SimulatedGuild,
+    count: int,
+    rng: random.Random,
+    results: Results,
+    args,
+) -> None:
+    for _ in range(count):
+        content = pick_command(rng, args)
+        message = BenchMessage(
+            f"{args.prefix}{content}",
+            rng.choice(guild.listeners),
+            guild.text_channel,
+            guild.guild,
+        )
+
+        started = time.perf_counter()
+        ctx = await bot.get_context(message, cls=BenchContext)
+        await bot.invoke(ctx)
+        results.record(content.split()[0], time.perf_counter() - started)
+
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+async def start_bot(uri: str, args) -> commands.Bot:
+    settings = bot_handler.load_settings(0) if args.settings is None else args.settings
+    settings = {
+        **settings,
+        "lavalink": {"nodes": [{"identifier": "bench", "uri": uri, "password": "bench"}]},
+        "version_check": {"enabled": False},
+        "metrics": {"enabled": False},
+        "snapshots": {"enabled": False},
+        "play_history": {"enabled": False},
+    }
+
+    intents = bot_handler.create_intents(settings.get("intents"))
+
+    bot = bot_handler.Bot(
+        command_prefix=bot_handler.check_prefixes([args.prefix], True),
+        intents=intents,
+        member_cache_flags=bot_handler.create_member_cache_flags(
+            settings.get("member_cache_flags"), intents
+        ),
+        help_command=None,
+        settings=settings,
+        owner_id=1,
+    )
+    bot.ws = BenchGateway(bot)
+    bot._connection.user = discord.ClientUser(
+        state=bot._connection, data=user_payload(BOT_ID, "djissu", bot=True)
+    )
+
+    await bot._async_setup_hook()
+    await bot.setup_hook()
+    bot._ready.set()
+
+    deadline = time.monotonic() + 10
+    while not (
+        bot.get_cog("music")
+        and all(
+            node.status is wavelink.NodeStatus.CONNECTED
+            for node in wavelink.Pool.nodes.values()
+        )
+    ):
+        if time.monotonic() > deadline:
+            raise RuntimeError("The bot did not finish starting against the fake node.")
+        await asyncio.sleep(0.05)
+
+    return bot
+
+
+def report(
+    results: Results,
+    elapsed: float,
+    bot,
+    server: FakeLavalink,
+    guilds: list[SimulatedGuild],
+    memory: dict,
+) -> dict:
+    cog = bot.get_cog("music")
+    all_timings = [value for values in results.timings.values() for value in values]
+
+    summary = {
+        "commands": len(all_timings),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(all_timings) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 0.5) * 1000, 3),
+                "p99": round(percentile(values, 0.99) * 1000, 3),
+                "max": round(max(values, default=0) * 1000, 3),
+            }
+            for name, values in {"all": all_timings, **results.timings}.items()
+        },
+        "errors": results.errors,
+        "search_cache": {
+            "hits": cog.search_cache.hits,
+            "misses": cog.search_cache.misses,
+            "coalesced": cog.search_cache.coalesced,
+            "entries": len(cog.search_cache),
+        },
+        "lavalink_requests": dict(sorted(server.requests.items())),
+        "messages": {
+            "sent": sum(guild.text_channel.sent for guild in guilds),
+            "edited": sum(guild.text_channel.edits for guild in guilds),
+        },
+        "players": len(bot.voice_clients),
+        "queued_tracks": sum(len(vc.queue) for vc in bot.voice_clients),
+        "memory": memory,
+    }
+
+    print("----------")
+    print(
+        f"{summary['commands']} commands in {summary['seconds']}s "
+        f"({summary['throughput']} commands/s)"
+    )
+    print(f"{'command':<8} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in summary["latency_ms"].items():
+        print(
+            f"{name:<8} {stats['count']:>7} {stats['p50']:>9} {stats['p99']:>9} {stats['max']:>9}"
+        )
+    print("----------")
+    print(f"Errors: {summary['errors'] or 'none'}")
+    print(f"Search cache: {summary['search_cache']}")
+    print(f"Lavalink requests: {summary['lavalink_requests']}")
+    print(f"Discord messages: {summary['messages']}")
+    print(f"Players: {summary['players']}, queued tracks: {summary['queued_tracks']}")
+    print(f"Memory: {memory}")
+    print(
+        f"Track gap p50: {metrics.track_gap_seconds.quantile(0.5) * 1000}ms "
+        f"({metrics.track_gap_seconds.count()} transitions)"
+    )
+
+    return summary
+
+
+async def main(args) -> dict:
+    rng = random.Random(args.seed)
+    server = FakeLavalink(
+        latency=args.latency / 1000,
+        track_seconds=args.track_seconds,
+        playlist_size=args.playlist_size,
+    )
+    uri = await server.start()
+
+    bot = await start_bot(uri, args)
+    results = Results()
+    bot.add_listener(results.on_command_error, "on_command_error")
+
+    guilds = [SimulatedGuild(bot, index, args.listeners) for index in range(args.guilds)]
+    counts = [args.commands // args.guilds] * args.guilds
+    for index in range(args.commands % args.guilds):
+        counts[index] += 1
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[
+            run_guild(bot, guild, count, random.Random(rng.random()), results, args)
+            for guild, count in zip(guilds, counts)
+        ]
+    )
+    elapsed = time.perf_counter() - started
+
+    cog = bot.get_cog("music")
+    memory = {
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "queues_bytes": sum(deep_sizeof(vc.queue._items) for vc in bot.voice_clients),
+        "search_cache_bytes": deep_sizeof(cog.search_cache._entries),
+    }
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update(traced_current_bytes=current, traced_peak_bytes=peak)
+
+    summary = report(results, elapsed, bot, server, guilds, memory)
+
+    await bot.close()
+    await wavelink.Pool.close()
+    await server.close()
+    return summary
+
+
+def parse_args(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=20, help="Simulated guilds.")
+    parser.add_argument("--commands", type=int, default=2000, help="Total commands to send.")
+    parser.add_argument("--listeners", type=int, default=3, help="Members in each voice channel.")
+    parser.add_argument("--popular", type=int, default=200, help="Distinct popular search queries.")
+    parser.add_argument("--playlist-ratio", type=float, default=0.05, help="Share of plays that load a playlist.")
+    parser.add_argument("--playlist-size", type=int, default=200, help="Tracks in each playlist.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Added Lavalink REST latency in ms.")
+    parser.add_argument("--track-seconds", type=float, default=None, help="End every track after this long.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Max random pause between a guild's commands in seconds.")
+    parser.add_argument("--prefix", default="!")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="Also trace Python allocations (slower).")
+    parser.add_argument("--output", help="Write the summary as JSON to this path.")
+    parser.add_argument("--settings", type=json.loads, default=None, help="Bot settings as JSON instead of bot_settings_0.json.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.chdir(ROOT)
+    summary = asyncio.run(main(args))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(summary, fp, indent=2)
@@ -0,0 +1,278 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from aiohttp import web
+
+
+def make_track(identifier: str, title: str, author: str, length: int) -> dict:
+    info = {
+        "identifier": identifier,
+        "isSeekable": True,
+        "author": author,
+        "length": length,
+        "isStream": False,
+        "position": 0,
+        "title": title,
+        "uri": f"https://example.com/watch?v={identifier}",
+        "artworkUrl": None,
+        "isrc": None,
+        "sourceName": "youtube",
+    }
+    encoded = base64.b64encode(json.dumps(info).encode()).decode()
+    return {"encoded": encoded, "info": info, "pluginInfo": {}, "userData": {}}
+
+
+def decode_track(encoded: str) -> dict:
+    info = json.loads(base64.b64decode(encoded))
+    return {"encoded": encoded, "info": info, "pluginInfo": {}, "userData": {}}
+
+
+class FakeLavalink:
+    """A stand-in Lavalink v4 server covering the REST and websocket surface wavelink uses.
+
+    Tracks never produce audio. When `track_seconds` is set, every started track
+    finishes after that many seconds so queue transitions are exercised."""
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0.0,
+        track_seconds: float | None = None,
+        search_results: int = 5,
+        playlist_size: int = 200,
+    ) -> None:
+        self.latency = latency
+        self.track_seconds = track_seconds
+        self.search_results = search_results
+        self.playlist_size = playlist_size
+
+        self.sockets: set[web.WebSocketResponse] = set()
+        self.players: dict[str, dict] = {}
+        self.requests: dict[str, int] = {}
+        self.started_at = time.monotonic()
+        self.runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/v4/websocket", self.websocket)
+        self.app.router.add_get("/v4/info", self.info)
+        self.app.router.add_get("/v4/stats", self.stats)
+        self.app.router.add_get("/v4/loadtracks", self.load_tracks)
+        self.app.router.add_get("/v4/decodetrack", self.decode_track)
+        self.app.router.add_post("/v4/decodetracks", self.decode_tracks)
+        self.app.router.add_patch("/v4/sessions/{session}", self.update_session)
+        self.app.router.add_patch(
+            "/v4/sessions/{session}/players/{guild}", self.update_player
+        )
+        self.app.router.add_delete(
+            "/v4/sessions/{session}/players/{guild}", self.destroy_player
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def close(self) -> None:
+        for socket in list(self.sockets):
+            await socket.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def respond(self, route: str) -> None:
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_event(self, payload: dict) -> None:
+        for socket in list(self.sockets):
+            if not socket.closed:
+                await socket.send_json(payload)
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.add(socket)
+        await socket.send_json({"op": "ready", "resumed": False, "sessionId": "bench"})
+
+        async for _ in socket:
+            pass
+
+        self.sockets.discard(socket)
+        return socket
+
+    async def info(self, request: web.Request) -> web.Response:
+        await self.respond("info")
+        return web.json_response(
+            {
+                "version": {"semver": "4.0.0", "major": 4, "minor": 0, "patch": 0},
+                "buildTime": 0,
+                "git": {"branch": "bench", "commit": "bench", "commitTime": 0},
+                "jvm": "bench",
+                "lavaplayer": "bench",
+                "sourceManagers": ["youtube"],
+                "filters": [],
+                "plugins": [],
+            }
+        )
+
+    async def stats(self, request: web.Request) -> web.Response:
+        await self.respond("stats")
+        playing = sum(1 for player in self.players.values() if player["track"])
+        return web.json_response(
+            {
+                "players": len(self.players),
+                "playingPlayers": playing,
+                "uptime": int((time.monotonic() - self.started_at) * 1000),
+                "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+                "cpu": {"cores": 1, "systemLoad": 0.0, "lavalinkLoad": 0.0},
+            }
+        )
+
+    async def load_tracks(self, request: web.Request) -> web.Response:
+        await self.respond("loadtracks")
+        identifier = request.query.get("identifier", "")
+        seed = hashlib.sha1(identifier.encode()).hexdigest()[:10]
+
+        if "playlist" in identifier:
+            tracks = [
+                make_track(f"{seed}{index}", f"Track {index}", f"Artist {index % 7}", 180_000)
+                for index in range(self.playlist_size)
+            ]
+            return web.json_response(
+                {
+                    "loadType": "playlist",
+                    "data": {
+                        "info": {"name": f"Playlist {seed}", "selectedTrack": -1},
+                        "pluginInfo": {},
+                        "tracks": tracks,
+                    },
+                }
+            )
+        elif "://" in identifier:
+            return web.json_response(
+                {
+                    "loadType": "track",
+                    "data": make_track(seed, f"Track {seed}", "Artist", 200_000),
+                }
+            )
+
+        query = identifier.partition(":")[2] or identifier
+        tracks = [
+            make_track(f"{seed}{index}", f"{query} ({index})", f"Artist {seed[:3]}", 210_000)
+            for index in range(self.search_results)
+        ]
+        return web.json_response({"loadType": "search", "data": tracks})
+
+    async def decode_track(self, request: web.Request) -> web.Response:
+        await self.respond("decodetrack")
+        return web.json_response(decode_track(request.query["encodedTrack"]))
+
+    async def decode_tracks(self, request: web.Request) -> web.Response:
+        await self.respond("decodetracks")
+        return web.json_response([decode_track(encoded) for encoded in await request.json()])
+
+    async def update_session(self, request: web.Request) -> web.Response:
+        await self.respond("session")
+        return web.json_response({"resuming": True, "timeout": 60})
+
+    def player_payload(self, guild: str) -> dict:
+        player = self.players[guild]
+        return {
+            "guildId": guild,
+            "track": player["track"],
+            "volume": 100,
+            "paused": player["paused"],
+            "state": {"time": 0, "position": 0, "connected": True, "ping": 0},
+            "voice": {},
+            "filters": {},
+        }
+
+    async def update_player(self, request: web.Request) -> web.Response:
+        await self.respond("update_player")
+        guild = request.match_info["guild"]
+        body = await request.json()
+        player = self.players.setdefault(
+            guild, {"track": None, "paused": False, "generation": 0}
+        )
+
+        if "paused" in body:
+            player["paused"] = bool(body["paused"])
+
+        if "track" in body:
+            encoded = body["track"].get("encoded")
+            no_replace = request.query.get("noReplace") == "True"
+
+            if encoded is None:
+                if player["track"]:
+                    self.end_track(guild, "stopped")
+            elif not (no_replace and player["track"]):
+                if player["track"]:
+                    self.end_track(guild, "replaced")
+                self.start_track(guild, decode_track(encoded))
+
+        return web.json_response(self.player_payload(guild))
+
+    async def destroy_player(self, request: web.Request) -> web.Response:
+        await self.respond("destroy_player")
+        self.players.pop(request.match_info["guild"], None)
+        return web.Response(status=204)
+
+    def start_track(self, guild: str, track: dict) -> None:
+        player = self.players[guild]
+        player["track"] = track
+        player["generation"] += 1
+        generation = player["generation"]
+
+        asyncio.create_task(
+            self.send_event(
+                {"op": "event", "type": "TrackStartEvent", "guildId": guild, "track": track}
+            )
+        )
+        if self.track_seconds:
+            asyncio.get_running_loop().call_later(
+                self.track_seconds, self.finish_track, guild, generation
+            )
+
+    def finish_track(self, guild: str, generation: int) -> None:
+        player = self.players.get(guild)
+        if player and player["track"] and player["generation"] == generation:
+            self.end_track(guild, "finished")
+
+    def end_track(self, guild: str, reason: str) -> None:
+        player = self.players[guild]
+        track, player["track"] = player["track"], None
+        asyncio.create_task(
+            self.send_event(
+                {
+                    "op": "event",
+                    "type": "TrackEndEvent",
+                    "guildId": guild,
+                    "track": track,
+                    "reason": reason,
+                }
+            )
+        )
+
+
+async def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a stand-in Lavalink v4 server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2333)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--track-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    server = FakeLavalink(latency=args.latency, track_seconds=args.track_seconds)
+    print(f"Fake Lavalink listening on {await server.start(args.host, args.port)}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
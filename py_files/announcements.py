@@ -0,0 +1,141 @@
+import asyncio
+import discord
+import logging
+import time
+from typing import Awaitable, Callable
+import metrics
+
+Announcement = Callable[[Callable[..., Awaitable[discord.Message]]], Awaitable]
+
+
+class ChannelAnnouncer:
+    """Posts announcements to one channel, keeping only the newest one while a burst settles.
+
+    Sends are paced by a local token bucket shaped like Discord's per-channel message
+    limit, so bursts wait here instead of piling up as 429s in the HTTP client."""
+
+    def __init__(
+        self,
+        channel: discord.abc.Messageable,
+        debounce: float = 0.75,
+        max_delay: float = 3.0,
+        rate: int = 5,
+        per: float = 5.0,
+        persistent: bool = False,
+    ) -> None:
+        self.channel = channel
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.rate = rate
+        self.per = per
+        self.persistent = persistent
+
+        self.message: discord.Message | None = None
+        self.pending: Announcement | None = None
+        self.first_submitted: float = 0.0
+        self.last_submitted: float = 0.0
+        self.tokens: float = rate
+        self.refilled: float = time.monotonic()
+        self.task: asyncio.Task | None = None
+
+    def submit(self, announcement: Announcement) -> None:
+        now = time.monotonic()
+        if self.pending:
+            metrics.announcements_total.inc(outcome="coalesced")
+        else:
+            self.first_submitted = now
+        self.pending = announcement
+        self.last_submitted = now
+
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    def cancel(self) -> None:
+        self.pending = None
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def run(self) -> None:
+        while self.pending:
+            # Wait for the burst to go quiet, but never hold an announcement past max_delay.
+            while (
+                delay := min(
+                    self.last_submitted + self.debounce,
+                    self.first_submitted + self.max_delay,
+                )
+                - time.monotonic()
+            ) > 0:
+                await asyncio.sleep(delay)
+
+            await self.acquire()
+
+            announcement, self.pending = self.pending, None
+            started_at = time.perf_counter()
+            try:
+                await announcement(self.send)
+            except Exception as exc:
+                logging.getLogger("discord").error(
+                    "Could not send an announcement", exc_info=exc
+                )
+            metrics.announcement_seconds.observe(time.perf_counter() - started_at)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rate, self.tokens + (now - self.refilled) * self.rate / self.per
+            )
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+    async def send(self, **kwargs) -> discord.Message:
+        if self.persistent and self.message:
+            file = kwargs.pop("file", None)
+            try:
+                self.message = await self.message.edit(
+                    content=kwargs.get("content"),
+                    embed=kwargs.get("embed"),
+                    attachments=[file] if file else [],
+                )
+                metrics.announcements_total.inc(outcome="edited")
+                return self.message
+            except discord.NotFound:
+                self.message = None
+                if file:
+                    kwargs["file"] = file
+
+        message = await self.channel.send(**kwargs)
+        metrics.announcements_total.inc(outcome="sent")
+        if self.persistent:
+            self.message = message
+        return message
+
+
+class AnnouncementDispatcher:
+    def __init__(self, **options) -> None:
+        self.options = options
+        self.announcers: dict[int, ChannelAnnouncer] = {}
+
+    def submit(
+        self, channel: discord.abc.Messageable, announcement: Announcement
+    ) -> None:
+        if not (announcer := self.announcers.get(channel.id)):
+            announcer = self.announcers[channel.id] = ChannelAnnouncer(
+                channel, **self.options
+            )
+        announcer.channel = channel
+        announcer.submit(announcement)
+
+    def forget(self, channel_id: int, flush: bool = False) -> None:
+        if announcer := self.announcers.pop(channel_id, None):
+            # Flushing lets an announcement that is already waiting go out first.
+            if not flush:
+                announcer.cancel()
+
+    def close(self) -> None:
+        for announcer in self.announcers.values():
+            announcer.cancel()
+        self.announcers.clear()
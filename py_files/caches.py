@@ -0,0 +1,146 @@
+import asyncio
+import aiohttp
+import time
+from collections import OrderedDict
+import wavelink
+import metrics
+
+
+class SearchCache:
+    """LRU + TTL cache in front of `wavelink.Playable.search`.
+
+    Concurrent lookups for the same key share one in-flight request."""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 600) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[float, wavelink.Search]] = (
+            OrderedDict()
+        )
+        self._pending: dict[tuple[str, str], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def normalize(
+        self, query: str, source: wavelink.TrackSource | str | None = None
+    ) -> tuple[str, str]:
+        query = " ".join(query.split())
+        if "://" not in query:
+            query = query.casefold()
+        return (str(getattr(source, "value", source) or ""), query)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def search(
+        self,
+        query: str,
+        source: wavelink.TrackSource | str | None = wavelink.TrackSource.YouTubeMusic,
+    ) -> wavelink.Search:
+        key = self.normalize(query, source)
+
+        if entry := self._entries.get(key):
+            expires, result = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.search_total.inc(outcome="hit")
+                return result
+            del self._entries[key]
+
+        if task := self._pending.get(key):
+            self.coalesced += 1
+            metrics.search_total.inc(outcome="coalesced")
+        else:
+            self.misses += 1
+            metrics.search_total.inc(outcome="miss")
+            task = self._pending[key] = asyncio.create_task(
+                self._fetch(key, query, source)
+            )
+
+        return await asyncio.shield(task)
+
+    async def _fetch(
+        self,
+        key: tuple[str, str],
+        query: str,
+        source: wavelink.TrackSource | str | None,
+    ) -> wavelink.Search:
+        started = time.perf_counter()
+        try:
+            result: wavelink.Search = await wavelink.Playable.search(
+                query, source=source
+            )
+        finally:
+            del self._pending[key]
+            metrics.search_seconds.observe(time.perf_counter() - started)
+
+        if result and not (type(result) == list and result[0].is_stream):
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return result
+
+
+class ArtworkCache:
+    """In-memory artwork bytes keyed by URL, evicted LRU once `max_bytes` is exceeded."""
+
+    def __init__(
+        self, max_bytes: int = 16 * 1024 * 1024, max_item_bytes: int = 2 * 1024 * 1024
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, url: str) -> bytes | None:
+        data = self._entries.get(url)
+        if data is not None:
+            self._entries.move_to_end(url)
+        return data
+
+    def put(self, url: str, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+
+        if (old := self._entries.pop(url, None)) is not None:
+            self.size -= len(old)
+
+        self._entries[url] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    async def fetch(self, url: str, session: aiohttp.ClientSession) -> bytes | None:
+        if (data := self.get(url)) is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        try:
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    return None
+                data = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+        self.put(url, data)
+        return data
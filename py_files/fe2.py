@@ -0,0 +1,85 @@
+import math
+import numpy as np
+
+MAX_PLAYERS = 16
+# Difficulty lost at the end of a round, indexed by base difficulty - 1.
+DECAY = np.array([0.4, 0.5, 0.6, 0.65, 1.5])
+# Every (2x, 1x) boost pair that fits in the five boost stacks.
+BOOSTS = [
+    (boost_2x, boost_1x)
+    for boost_2x in range(3)
+    for boost_1x in range(6 - 2 * boost_2x)
+]
+
+
+def intensity_change(base, survivor_ratio, boost_2x, boost_1x):
+    """Difficulty gained over one round. Works elementwise on NumPy arrays."""
+    # Summed in the calculator's original order, so results match it to the last bit.
+    return survivor_ratio - DECAY[np.asarray(base) - 1] + (boost_2x + 0.5 * boost_1x)
+
+
+def boost_index(boost_2x: int, boost_1x: int) -> int:
+    if boost_2x < 0 or boost_1x < 0 or 2 * boost_2x + boost_1x > 5:
+        raise ValueError(
+            "Amount of boosts are either greater than maximum of 5 'stacks' or below minimum of 0 'stacks'."
+        )
+    return BOOSTS.index((boost_2x, boost_1x))
+
+
+def base_of(difficulty: float) -> int:
+    if not 1 <= difficulty < 6:
+        raise ValueError("Difficulty must be between 1.0 and 5.99.")
+    return math.floor(difficulty)
+
+
+def build_changes() -> np.ndarray:
+    # Python's round, not np.round, which lands the other way on a few halves.
+    ratios = np.array(
+        [
+            [
+                round(survivors / total, 2) if survivors <= total else np.nan
+                for survivors in range(MAX_PLAYERS + 1)
+            ]
+            for total in range(1, MAX_PLAYERS + 1)
+        ]
+    )
+
+    boosts = np.array(BOOSTS)[:, :, None, None]
+    return intensity_change(
+        np.arange(1, 6)[:, None, None, None],
+        ratios,
+        boosts[:, 0],
+        boosts[:, 1],
+    )
+
+
+# CHANGES[base - 1, boost, total - 1, survivors]; NaN where survivors > total.
+CHANGES = build_changes()
+
+
+def required_survivors(minimum: np.ndarray, target: float, total: int) -> np.ndarray:
+    """Fewest survivors lifting a round from `minimum` to `target`, or -1 if none can.
+
+    Each survivor is worth 1 / `total` of a difficulty, as in the original calculator."""
+    required = np.maximum(np.ceil((target - minimum) / (1 / total)), 0).astype(int)
+    return np.where(required > total, -1, required)
+
+
+def what_if(
+    difficulty: float, total: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Every outcome of a round for each boost pair in `BOOSTS`.
+
+    Returns the next difficulty by survivors (0 to `total`), and the survivors
+    needed to hold and to raise the current base difficulty (-1 if impossible)."""
+    base = base_of(difficulty)
+    if not 1 <= total <= MAX_PLAYERS:
+        raise ValueError(f"Total players must be between 1 and {MAX_PLAYERS}.")
+
+    outcomes = difficulty + CHANGES[base - 1, :, total - 1, : total + 1]
+    hold = required_survivors(outcomes[:, 0], base, total)
+    if base < 5:
+        raise_ = required_survivors(outcomes[:, 0], base + 1, total)
+    else:
+        raise_ = np.full(len(BOOSTS), -1)
+    return outcomes, hold, raise_
@@ -3,18 +3,28 @@ from discord.ext import commands, tasks
 import os
 import asyncio
 import json
-from issutilities import DIRS, craft, COLORS, actions
+from issutilities import DIRS, craft, COLORS
 import random
 import traceback
 import wavelink
 import platform
+import aiohttp
+import metrics
+from prefixes import PrefixResolver
 
 
 class bot_handler:
     class Bot(commands.Bot):
-        def __init__(self, *args, **kwargs) -> None:
+        def __init__(self, *args, settings: dict | None = None, **kwargs) -> None:
             super().__init__(*args, **kwargs)
             self.logger = logging.getLogger("discord")
+            self.settings = settings or {}
+            self.http_session: aiohttp.ClientSession | None = None
+            self.nodes = node_handler(self.settings.get("lavalink"))
+            self.node_monitor: tasks.Loop | None = None
+            self.metrics_runner = None
+            self.cog_states: dict[str, dict] = {}
+            self.closing = False
 
         def error_handler(self, task: asyncio.Task) -> None:
             exc = task.exception()
@@ -23,8 +33,37 @@ class bot_handler:
                 traceback.print_exception(exc)
                 self.logger.error("An error occurred", exc_info=exc)
 
+        def cache_sizes(self) -> dict[str, int]:
+            return {
+                "guilds": len(self.guilds),
+                "channels": sum(len(guild.channels) for guild in self.guilds),
+                "members": sum(len(guild.members) for guild in self.guilds),
+                "voice_states": sum(
+                    len(channel.voice_states)
+                    for guild in self.guilds
+                    for channel in guild.voice_channels + guild.stage_channels
+                ),
+                "users": len(self.users),
+                "messages": len(self.cached_messages),
+            }
+
+        async def process_commands(self, message: discord.Message, /) -> None:
+            # Most messages are chat, so they are dropped before a Context is built.
+            if message.author.bot or (
+                isinstance(self.command_prefix, PrefixResolver)
+                and not self.command_prefix.match(self, message)
+            ):
+                return
+            await super().process_commands(message)
+
         async def run_once_when_ready(self) -> None:
             await self.wait_until_ready()
+            enabled = [name for name, value in self.intents if value]
+            print(f"----------\nIntents: {', '.join(enabled)}")
+            print(
+                "Cache sizes: "
+                + ", ".join(f"{name}={size}" for name, size in self.cache_sizes().items())
+            )
             print("----------\nLoading cogs...")
             await self.load_cogs()
 
@@ -65,15 +104,70 @@ class bot_handler:
 
         async def setup_hook(self) -> None:
             print("Launching [dj]issu...")
+            self.http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10),
+            )
             runner = asyncio.create_task(self.run_once_when_ready())
             runner.add_done_callback(self.error_handler)
-            uri = "http://localhost:2333"
-            wvlnktoken = os.getenv("WAVELINK_TOKEN", "youshallnotpass").replace('"', "")
-            nodes = [wavelink.Node(uri=uri, password=wvlnktoken)]
 
-            await wavelink.Pool.connect(nodes=nodes, client=self)
+            if (version_check := self.settings.get("version_check", {})).get(
+                "enabled", True
+            ):
+                checker = asyncio.create_task(
+                    version_handler.check_version(self.http_session, version_check)
+                )
+                checker.add_done_callback(self.error_handler)
+
+            await wavelink.Pool.connect(nodes=self.nodes.create_nodes(), client=self)
+            self.node_monitor = tasks.loop(seconds=self.nodes.poll_interval)(
+                self.nodes.poll
+            )
+            self.node_monitor.start()
 
-            print("Wavelink connected.")
+            print(f"Wavelink connected ({len(wavelink.Pool.nodes)} node(s)).")
+
+            metrics.registry.gauge(
+                "djissu_queued_tracks",
+                "Tracks waiting in player queues.",
+                lambda: sum(len(getattr(vc, "queue", ())) for vc in self.voice_clients),
+            )
+            metrics.registry.gauge(
+                "djissu_node_players",
+                "Players connected to each Lavalink node.",
+                lambda: {
+                    (("node", identifier),): len(node.players)
+                    for identifier, node in wavelink.Pool.nodes.items()
+                },
+            )
+            metrics.registry.gauge(
+                "djissu_cached_objects",
+                "Objects held in the discord.py cache.",
+                lambda: {
+                    (("kind", kind),): size for kind, size in self.cache_sizes().items()
+                },
+            )
+            if (metrics_settings := self.settings.get("metrics", {})).get("enabled"):
+                self.metrics_runner = await metrics.registry.serve(
+                    metrics_settings.get("host", "127.0.0.1"),
+                    metrics_settings.get("port", 9108),
+                )
+
+        async def close(self) -> None:
+            self.closing = True
+            if self.node_monitor and self.node_monitor.is_running():
+                self.node_monitor.cancel()
+
+            await super().close()
+
+            if self.metrics_runner:
+                await self.metrics_runner.cleanup()
+
+            if self.http_session and not self.http_session.closed:
+                await self.http_session.close()
+
+    class AutoShardedBot(Bot, commands.AutoShardedBot):
+        pass
 
     class HelpCommand(commands.DefaultHelpCommand):
         def __init__(self, *args, **kwargs) -> None:
@@ -86,36 +180,96 @@ class bot_handler:
             "command_prefix": "!",
             "description": "A Discord bot.",
             "help_command": commands.DefaultHelpCommand(),
-            "intents": discord.Intents.all(),
+            "intents": self.create_intents(),
+            "member_cache_flags": None,
+            "chunk_guilds_at_startup": False,
             "case_insensitive": False,
         }
         self.owner_id = int(os.getenv("OWNER_ID", "1234567890").replace('"', ""))
 
     @classmethod
-    def check_prefixes(self, prefixes: list | None = ["@"]) -> any:
-        prefix_mention, other_prefixes = False, False
-
-        for index, prefix in enumerate(prefixes):
-            if prefix == "@":
-                prefix_mention = True
-                prefixes.pop(index)
-            elif prefix_mention and other_prefixes:
-                break
-            else:
-                other_prefixes = True
+    def load_settings(self, version: int | None = 0) -> dict:
+        with open(f"{DIRS.JSON}/bot_settings_{version}.json") as fp:
+            return json.load(fp)
 
-        if prefix_mention and other_prefixes:
-            return commands.when_mentioned_or(*prefixes)
-        elif prefix_mention:
-            return commands.when_mentioned
-        elif other_prefixes:
-            return prefixes
+    @classmethod
+    def create_intents(self, names: list | None = None) -> discord.Intents:
+        if names is None:
+            # Enough for prefix commands and voice; no presences, typing or member lists.
+            names = ["guilds", "voice_states", "guild_messages", "message_content"]
+        return discord.Intents(**{name: True for name in names})
+
+    @classmethod
+    def create_member_cache_flags(
+        self, names: list | None = None, intents: discord.Intents | None = None
+    ) -> discord.MemberCacheFlags:
+        if names is None:
+            return discord.MemberCacheFlags.from_intents(intents or self.create_intents())
+
+        flags = discord.MemberCacheFlags.none()
+        for name in names:
+            setattr(flags, name, True)
+        return flags
+
+    @classmethod
+    async def recommended_shards(self, token: str) -> int:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                "https://discord.com/api/v10/gateway/bot",
+                headers={"Authorization": f"Bot {token}"},
+                timeout=aiohttp.ClientTimeout(total=10),
+            ) as r:
+                r.raise_for_status()
+                return (await r.json())["shards"]
+
+    @classmethod
+    def check_prefixes(
+        self,
+        prefixes: list | None = None,
+        case_insensitive: bool = False,
+        settings: dict | None = None,
+    ) -> PrefixResolver:
+        prefixes = prefixes or ["@"]
+        return PrefixResolver(
+            [prefix for prefix in prefixes if prefix != "@"],
+            mention="@" in prefixes,
+            case_insensitive=case_insensitive,
+            **(settings or {}),
+        )
 
     def create_bot(
-        self, use_default: bool | None = False, version: int | None = 0
+        self,
+        use_default: bool | None = False,
+        version: int | None = 0,
+        shard_ids: list[int] | None = None,
+        shard_count: int | None = None,
+        process_index: int = 0,
     ) -> commands.Bot:
-        bot_settings = json.load(open(f"{DIRS.JSON}/bot_settings_{version}.json"))
+        bot_settings = self.load_settings(version)
         set_dict = self.default_bot
+        sharding = bot_settings.get("sharding", {})
+
+        if process_index:
+            # Only the first shard process checks versions; the rest take the next metrics ports.
+            bot_settings["version_check"] = {
+                **bot_settings.get("version_check", {}),
+                "enabled": False,
+            }
+            if "metrics" in bot_settings:
+                bot_settings["metrics"] = {
+                    **bot_settings["metrics"],
+                    "port": bot_settings["metrics"].get("port", 9108) + process_index,
+                }
+
+        if shard_ids or (sharding.get("enabled") and not use_default):
+            bot_class = self.AutoShardedBot
+            shard_options = {
+                "shard_ids": shard_ids,
+                "shard_count": shard_count or sharding.get("shard_count"),
+            }
+        else:
+            bot_class = self.Bot
+            shard_options = {}
 
         if not use_default:
             set_dict["activity"] = craft.activity(
@@ -125,57 +279,209 @@ class bot_handler:
                 bot_settings["allowed_mentions"]
             )
             set_dict["command_prefix"] = self.check_prefixes(
-                bot_settings["command_prefix"]
+                bot_settings["command_prefix"],
+                bot_settings["case_insensitive"],
+                bot_settings.get("guild_prefixes"),
             )
             set_dict["description"] = bot_settings["description"]
             set_dict["case_insensitive"] = bot_settings["case_insensitive"]
+            set_dict["intents"] = self.create_intents(bot_settings.get("intents"))
+            set_dict["member_cache_flags"] = bot_settings.get("member_cache_flags")
+            set_dict["chunk_guilds_at_startup"] = bot_settings.get(
+                "chunk_guilds_at_startup", False
+            )
 
-        bot = self.Bot(
+        bot = bot_class(
             activity=set_dict["activity"],
             allowed_mentions=set_dict["allowed_mentions"],
             command_prefix=set_dict["command_prefix"],
             description=set_dict["description"],
             help_command=set_dict["help_command"],
             intents=set_dict["intents"],
+            member_cache_flags=self.create_member_cache_flags(
+                set_dict["member_cache_flags"], set_dict["intents"]
+            ),
+            chunk_guilds_at_startup=set_dict["chunk_guilds_at_startup"],
             case_insensitive=set_dict["case_insensitive"],
             owner_id=self.owner_id,
+            settings={} if use_default else bot_settings,
+            **shard_options,
         )
 
         @bot.command()
         async def close(ctx):
             await bot.close()
 
+        @bot.command(name="prefix")
+        @commands.guild_only()
+        async def prefix(ctx, *prefixes: str):
+            """
+            Shows or replaces this server's prefixes; `reset` restores the defaults."""
+            resolver = bot.command_prefix
+            if not isinstance(resolver, PrefixResolver):
+                return await ctx.reply("❌ Prefixes can't be changed on this bot.")
+
+            if not prefixes:
+                current = ", ".join(
+                    f"`{discord.utils.escape_markdown(prefix)}`"
+                    for prefix in resolver.prefixes_for(ctx.guild.id)
+                )
+                return await ctx.reply(f"🔧 Prefixes here: {current or 'mentions only'}")
+
+            if not ctx.author.guild_permissions.manage_guild:
+                return await ctx.reply(
+                    "❌ You need the Manage Server permission to change prefixes."
+                )
+
+            if prefixes == ("reset",):
+                await resolver.set(ctx.guild.id, None)
+                return await ctx.reply("🔧 Prefixes have been reset to the defaults.")
+
+            if problem := resolver.validate(list(prefixes)):
+                return await ctx.reply(f"❌ {problem}")
+
+            await resolver.set(ctx.guild.id, list(prefixes))
+            await ctx.reply(
+                "🔧 Prefixes set to "
+                + ", ".join(
+                    f"`{discord.utils.escape_markdown(prefix)}`"
+                    for prefix in resolver.prefixes_for(ctx.guild.id)
+                )
+            )
+
         return bot
 
 
+import copy
 import logging, logging.handlers
+import queue
+import time
 
 
 class log_handler:
+    listener: logging.handlers.QueueListener | None = None
+
+    class QueueHandler(logging.handlers.QueueHandler):
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            # The message and traceback are rendered eagerly here, on the logging thread
+            # (usually the event loop): the arguments are live objects that may change
+            # before the listener gets to them. Only the final formatting runs over there.
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = record.exc_text or logging.Formatter().formatException(
+                    record.exc_info
+                )
+                record.exc_info = None
+            return record
+
+    class JsonFormatter(logging.Formatter):
+        def format(self, record: logging.LogRecord) -> str:
+            entry = {
+                "time": self.formatTime(record, self.datefmt),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            if record.exc_info and not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            if record.exc_text:
+                entry["exc_info"] = record.exc_text
+            return json.dumps(entry, default=str)
+
+    class SamplingFilter(logging.Filter):
+        def __init__(
+            self,
+            sample_rates: dict | None = None,
+            event_sample_rates: dict | None = None,
+            rate_caps: dict | None = None,
+        ) -> None:
+            super().__init__()
+            self.sample_rates = sample_rates or {}
+            self.event_sample_rates = event_sample_rates or {}
+            self.rate_caps = rate_caps or {}
+            self.buckets: dict[str, tuple[float, float]] = {}
+
+        def filter(self, record: logging.LogRecord) -> bool:
+            if record.levelno >= logging.WARNING:
+                return True
+
+            key = record.name
+            if (
+                self.event_sample_rates
+                and key == "discord.gateway"
+                and isinstance(record.args, tuple)
+                and len(record.args) == 2
+                and isinstance(record.args[1], dict)
+            ):
+                key = f"event:{record.args[1].get('t') or record.args[1].get('op')}"
+                rate = self.event_sample_rates.get(key[6:], 1.0)
+            else:
+                rate = self.sample_rates.get(key, 1.0)
+
+            if rate < 1.0 and random.random() >= rate:
+                return False
+
+            if not (cap := self.rate_caps.get(key) or self.rate_caps.get(record.name)):
+                return True
+
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(key, (cap, now))
+            tokens = min(cap, tokens + (now - updated) * cap)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return False
+            self.buckets[key] = (tokens - 1, now)
+            return True
+
     @classmethod
-    def create_logging(self) -> None:
+    def create_logging(self, settings: dict | None = None, suffix: str = "") -> None:
+        settings = settings or {}
         logger = logging.getLogger("discord")
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(settings.get("level", "DEBUG"))
         logging.getLogger("discord.http").setLevel(logging.INFO)
 
         handler = logging.handlers.RotatingFileHandler(
-            filename=f"{DIRS.LOGGING}/discord.log",
+            filename=f"{DIRS.LOGGING}/discord{suffix}.{'jsonl' if settings.get('json') else 'log'}",
             encoding="utf-8",
             maxBytes=32 * 1024 * 1024,
             backupCount=5,
         )
         dt_fmt = "%Y-%m-%d %H:%M:%S"
-        formatter = logging.Formatter(
-            "[{asctime}] [{levelname}] {name}: {message}", dt_fmt, style="{"
-        )
+        if settings.get("json"):
+            formatter = self.JsonFormatter(datefmt=dt_fmt)
+        else:
+            formatter = logging.Formatter(
+                "[{asctime}] [{levelname}] {name}: {message}", dt_fmt, style="{"
+            )
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
 
+        queue_handler = self.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(
+            self.SamplingFilter(
+                settings.get("sample_rates"),
+                settings.get("event_sample_rates"),
+                settings.get("rate_caps"),
+            )
+        )
+        logger.addHandler(queue_handler)
 
-import requests
+        self.listener = logging.handlers.QueueListener(
+            queue_handler.queue, handler, respect_handler_level=True
+        )
+        self.listener.start()
+
+    @classmethod
+    def stop_logging(self) -> None:
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
 
 
 class version_handler:
+    cache_file = f"{DIRS.JSON}/version_cache.json"
+
     @classmethod
     def compare(
         self,
@@ -194,20 +500,59 @@ class version_handler:
             print(
                 f"{COLORS.UNDERLINE}Your {name} installation is potentially outdated, but the latest version could not be checked."
             )
-            actions._sleep(2)
         elif latest_ver != current_ver and latest_ver != "Unknown":
             print(
                 f"{COLORS.RED+COLORS.UNDERLINE}Your {name} installation IS OUTDATED! Consider updating it."
             )
-            actions._sleep(2)
         else:
             print(f"{COLORS.GREEN}Your {name} installation is up-to-date!")
-            actions._sleep(0.2)
 
         print(f"{COLORS.RESET}------------------")
 
     @classmethod
-    def check_version(self) -> None:
+    def load_cache(self, ttl: float) -> dict:
+        try:
+            with open(self.cache_file) as fp:
+                cache = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+        if time.time() - cache.get("checked_at", 0) > ttl:
+            return {}
+        return cache.get("latest", {})
+
+    @classmethod
+    def save_cache(self, latest: dict) -> None:
+        try:
+            with open(self.cache_file, "w") as fp:
+                json.dump({"checked_at": time.time(), "latest": latest}, fp)
+        except OSError:
+            pass
+
+    @classmethod
+    async def fetch_latest(
+        self, name: str, url: str, session: aiohttp.ClientSession, timeout: float
+    ) -> str:
+        try:
+            async with session.get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as r:
+                r.raise_for_status()
+                data = await r.json(content_type=None)
+
+            match (name):
+                case "Python":
+                    return data[0]["latest"]
+                case _:
+                    return list(data["releases"].keys())[-1]
+        except Exception:
+            return "Unknown"
+
+    @classmethod
+    async def check_version(
+        self, session: aiohttp.ClientSession, settings: dict | None = None
+    ) -> None:
+        settings = settings or {}
         comparisons = {
             "Python": [
                 platform.python_version(),
@@ -219,26 +564,137 @@ class version_handler:
             ],
             "wavelink": [wavelink.__version__, "https://pypi.org/pypi/wavelink/json"],
         }
-        actions.clear()
+        latest = self.load_cache(settings.get("cache_ttl", 6 * 60 * 60))
+
+        if missing := [name for name in comparisons if name not in latest]:
+            results = await asyncio.gather(
+                *[
+                    self.fetch_latest(
+                        name,
+                        comparisons[name][1],
+                        session,
+                        settings.get("timeout", 5),
+                    )
+                    for name in missing
+                ]
+            )
+            latest |= {
+                name: version
+                for name, version in zip(missing, results)
+                if version != "Unknown"
+            }
+            self.save_cache(latest)
+
+        print("----------")
+        for name, comparison in comparisons.items():
+            self.compare(comparison[0], latest.get(name, "Unknown"), name)
+
+
+class node_handler:
+    def __init__(self, settings: dict | None = None) -> None:
+        settings = settings or {}
+        self.node_settings = settings.get("nodes") or [
+            {"identifier": "main", "uri": "http://localhost:2333"}
+        ]
+        self.poll_interval = settings.get("poll_interval", 30)
+        self.max_failures = settings.get("max_failures", 3)
+
+        self.weights: dict[str, float] = {}
+        self.stats: dict[str, wavelink.StatsResponsePayload] = {}
+        self.failures: dict[str, int] = {}
+        self.drained: set[str] = set()
+
+    def create_nodes(self) -> list[wavelink.Node]:
+        default_password = os.getenv("WAVELINK_TOKEN", "youshallnotpass").replace('"', "")
+        nodes = []
+
+        for index, node_setting in enumerate(self.node_settings):
+            identifier = node_setting.get("identifier") or f"node-{index}"
+            self.weights[identifier] = max(float(node_setting.get("weight", 1)), 0.01)
+            nodes.append(
+                wavelink.Node(
+                    identifier=identifier,
+                    uri=node_setting["uri"],
+                    password=node_setting.get("password") or default_password,
+                )
+            )
 
-        for comparison in comparisons.items():
-            current_version = comparison[1][0]
+        return nodes
+
+    def penalty(self, node: wavelink.Node) -> float:
+        stats = self.stats.get(node.identifier)
+        if not stats:
+            return len(node.players) / self.weights.get(node.identifier, 1)
+
+        # Same weighting Lavalink clients use for load balancing.
+        penalty = max(stats.players, len(node.players))
+        penalty += 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+        if stats.frames:
+            penalty += 1.03 ** (500 * (stats.frames.deficit / 3000)) * 600 - 600
+            penalty += (1.03 ** (500 * (stats.frames.nulled / 3000)) * 300 - 300) * 2
+
+        return penalty / self.weights.get(node.identifier, 1)
+
+    def available_nodes(self) -> list[wavelink.Node]:
+        return [
+            node
+            for node in wavelink.Pool.nodes.values()
+            if node.status is wavelink.NodeStatus.CONNECTED
+            and node.identifier not in self.drained
+        ]
+
+    def best_node(self) -> wavelink.Node:
+        if not (nodes := self.available_nodes()):
+            return wavelink.Pool.get_node()
+        return min(nodes, key=self.penalty)
+
+    async def poll(self) -> None:
+        for node in wavelink.Pool.nodes.values():
             try:
-                (r := requests.get(comparison[1][1])).raise_for_status()
-
-                name = comparison[0]
-
-                match (name):
-                    case "Python":
-                        latest_version = r.json()[0]["latest"]
-                    case _:
-                        try:
-                            latest_version = list(
-                                json.loads(r.text)["releases"].keys()
-                            )[-1]
-                        except:
-                            latest_version = "Unknown"
-            except:
-                latest_version = "Unknown"
-
-            self.compare(current_version, latest_version, name)
+                if node.status is not wavelink.NodeStatus.CONNECTED:
+                    raise wavelink.NodeException()
+                self.stats[node.identifier] = await asyncio.wait_for(
+                    node.fetch_stats(), timeout=5
+                )
+            except Exception:
+                self.failures[node.identifier] = self.failures.get(node.identifier, 0) + 1
+                if (
+                    self.failures[node.identifier] >= self.max_failures
+                    and node.identifier not in self.drained
+                ):
+                    # A failed drain must not end the loop, or no node is ever checked again.
+                    try:
+                        await self.drain(node)
+                    except Exception as exc:
+                        logging.getLogger("discord").error(
+                            f"Could not drain Lavalink node {node.identifier}", exc_info=exc
+                        )
+            else:
+                self.failures[node.identifier] = 0
+                if node.identifier in self.drained:
+                    self.drained.discard(node.identifier)
+                    print(f"Lavalink node {node.identifier} is healthy again.")
+
+    async def drain(self, node: wavelink.Node) -> None:
+        self.drained.add(node.identifier)
+        self.stats.pop(node.identifier, None)
+        print(f"Lavalink node {node.identifier} failed its health checks, draining...")
+
+        if not self.available_nodes():
+            return
+
+        for player in list(node.players.values()):
+            try:
+                await player.switch_node(self.best_node())
+            except Exception as exc:
+                logging.getLogger("discord").error(
+                    f"Could not move player {player.guild.id} off {node.identifier}",
+                    exc_info=exc,
+                )
+                try:
+                    await player.disconnect()
+                except Exception as exc:
+                    logging.getLogger("discord").error(
+                        f"Could not disconnect player {player.guild.id} from {node.identifier}",
+                        exc_info=exc,
+                    )
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import re
+import sqlite3
+import time
+import wavelink
+from issutilities import DIRS
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    identifier TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    uri TEXT,
+    encoded TEXT NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plays (
+    guild_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks (id),
+    count INTEGER NOT NULL,
+    last_played REAL NOT NULL,
+    PRIMARY KEY (guild_id, track_id)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+    title, author, content = 'tracks', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS tracks_insert AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_update AFTER UPDATE OF title, author ON tracks BEGIN
+    INSERT INTO tracks_fts (tracks_fts, rowid, title, author)
+        VALUES ('delete', old.id, old.title, old.author);
+    INSERT INTO tracks_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+"""
+
+
+class PlayHistory:
+    """Tracks each guild has played, in a SQLite file with a full-text index.
+
+    Plays are buffered and written in batches off the event loop; lookups read
+    the index directly so autocomplete never waits on Lavalink."""
+
+    # Autocomplete values carry this so a picked suggestion can skip the search.
+    PICK_PREFIX = "history:"
+
+    def __init__(self, name: str = "play_history", max_suggestions: int = 25) -> None:
+        self.path = f"{DIRS.JSON}/{name}.sqlite3"
+        self.max_suggestions = max_suggestions
+        self.pending: list[tuple] = []
+
+        self.writer = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        self.writer.executescript(SCHEMA)
+        self.writer.execute("PRAGMA synchronous = NORMAL")
+        self.reader = sqlite3.connect(self.path, timeout=1)
+
+    def record(self, guild_id: int, track: wavelink.Playable) -> None:
+        if not track.encoded or not track.identifier:
+            return
+        self.pending.append(
+            (
+                guild_id,
+                track.identifier,
+                track.title,
+                track.author,
+                track.uri,
+                track.encoded,
+                json.dumps(track.raw_data.get("info", {}), separators=(",", ":")),
+                time.time(),
+            )
+        )
+
+    def write(self, plays: list[tuple]) -> None:
+        with self.writer:
+            for guild_id, identifier, *track, played_at in plays:
+                track_id = self.writer.execute(
+                    "INSERT INTO tracks (identifier, title, author, uri, encoded, info)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (identifier) DO UPDATE SET"
+                    " title = excluded.title, author = excluded.author,"
+                    " uri = excluded.uri, encoded = excluded.encoded, info = excluded.info"
+                    " RETURNING id",
+                    (identifier, *track),
+                ).fetchone()[0]
+                self.writer.execute(
+                    "INSERT INTO plays (guild_id, track_id, count, last_played)"
+                    " VALUES (?, ?, 1, ?)"
+                    " ON CONFLICT (guild_id, track_id) DO UPDATE SET"
+                    " count = count + 1, last_played = excluded.last_played",
+                    (guild_id, track_id, played_at),
+                )
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        plays, self.pending = self.pending, []
+        await asyncio.to_thread(self.write, plays)
+
+    @classmethod
+    def match_expression(self, query: str) -> str:
+        # Every word must appear, with the last one (still being typed) as a prefix.
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query.casefold()))
+
+    def suggest(self, guild_id: int, query: str) -> list[tuple[int, str, str]]:
+        if expression := self.match_expression(query):
+            rows = self.reader.execute(
+                "SELECT tracks.id, tracks.title, tracks.author FROM tracks_fts"
+                " JOIN tracks ON tracks.id = tracks_fts.rowid"
+                " JOIN plays ON plays.track_id = tracks.id AND plays.guild_id = ?"
+                " WHERE tracks_fts MATCH ?"
+                " ORDER BY plays.count DESC, plays.last_played DESC LIMIT ?",
+                (guild_id, expression, self.max_suggestions),
+            )
+        else:
+            rows = self.reader.execute(
+                "SELECT tracks.id, tracks.title, tracks.author FROM plays"
+                " JOIN tracks ON tracks.id = plays.track_id"
+                " WHERE plays.guild_id = ?"
+                " ORDER BY plays.last_played DESC LIMIT ?",
+                (guild_id, self.max_suggestions),
+            )
+        return rows.fetchall()
+
+    def get(self, guild_id: int, value: str) -> wavelink.Playable | None:
+        if not value.startswith(self.PICK_PREFIX):
+            return None
+        try:
+            track_id = int(value.removeprefix(self.PICK_PREFIX))
+        except ValueError:
+            return None
+
+        row = self.reader.execute(
+            "SELECT tracks.encoded, tracks.info FROM tracks"
+            " JOIN plays ON plays.track_id = tracks.id AND plays.guild_id = ?"
+            " WHERE tracks.id = ?",
+            (guild_id, track_id),
+        ).fetchone()
+        if not row:
+            return None
+        return wavelink.Playable(
+            {"encoded": row[0], "info": json.loads(row[1]), "pluginInfo": {}}
+        )
+
+    def close(self) -> None:
+        if self.pending:
+            self.write(self.pending)
+            self.pending = []
+        self.reader.close()
+        self.writer.close()
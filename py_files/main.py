@@ -1,19 +1,86 @@
-from handlers import log_handler, version_handler, bot_handler
+from handlers import log_handler, bot_handler
+import asyncio
+import math
+import multiprocessing
 import os, sys
+import time
 
 
-def main(args) -> None:
-    log_handler.create_logging()
-    version_handler.check_version()
+def run_bot(
+    settings_file_type: int,
+    shard_ids: list[int] | None = None,
+    shard_count: int | None = None,
+    process_index: int = 0,
+) -> None:
+    log_handler.create_logging(
+        bot_handler.load_settings(settings_file_type).get("logging"),
+        suffix=f".{process_index}" if shard_ids else "",
+    )
+
+    bot = bot_handler().create_bot(
+        version=settings_file_type,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        process_index=process_index,
+    )
+
+    try:
+        bot.run(token=os.getenv("DJISSU_TOKEN"), log_handler=None)
+    finally:
+        log_handler.stop_logging()
+
+
+def launch_shards(settings_file_type: int, sharding: dict) -> None:
+    shard_count = sharding.get("shard_count") or asyncio.run(
+        bot_handler.recommended_shards(os.getenv("DJISSU_TOKEN"))
+    )
+    process_count = min(sharding.get("processes", 1), shard_count)
+    per_process = math.ceil(shard_count / process_count)
+
+    print(f"Launching {shard_count} shard(s) across {process_count} process(es)...")
 
+    # Spawned workers start from a clean interpreter, each with its own event loop.
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for index in range(process_count):
+        shard_ids = list(
+            range(index * per_process, min((index + 1) * per_process, shard_count))
+        )
+        if not shard_ids:
+            break
+        if workers:
+            # Staggered so the workers do not all identify at once.
+            time.sleep(sharding.get("launch_delay", 5))
+
+        worker = context.Process(
+            target=run_bot,
+            args=(settings_file_type, shard_ids, shard_count, index),
+            name=f"djissu-shards-{shard_ids[0]}-{shard_ids[-1]}",
+        )
+        worker.start()
+        workers.append(worker)
+
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.join()
+
+
+def main(args) -> None:
     try:
         settings_file_type = int(args[1])
     except:
         settings_file_type = 0
 
-    bot = bot_handler().create_bot(version=settings_file_type)
+    sharding = bot_handler.load_settings(settings_file_type).get("sharding", {})
+    if sharding.get("enabled") and sharding.get("processes", 1) > 1:
+        return launch_shards(settings_file_type, sharding)
 
-    bot.run(token=os.getenv("DJISSU_TOKEN"), log_handler=None)
+    run_bot(settings_file_type)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+import bisect
+from typing import Callable
+from aiohttp import web
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(key: LabelKey, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(label_key(labels), 0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(key)} {value}"
+            for key, value in self.values.items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+    default_buckets = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+    )
+
+    def __init__(
+        self, name: str, description: str, buckets: tuple | None = None
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets or self.default_buckets)
+        self.values: dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = label_key(labels)
+        if not (series := self.values.get(key)):
+            series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, **labels) -> int:
+        series = self.values.get(label_key(labels))
+        return series[2] if series else 0
+
+    def mean(self, **labels) -> float:
+        series = self.values.get(label_key(labels))
+        return series[1] / series[2] if series else 0.0
+
+    def quantile(self, q: float, **labels) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        series = self.values.get(label_key(labels))
+        if not series:
+            return 0.0
+
+        target = q * series[2]
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), series[0]):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (bucket_counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                self.buckets + ("+Inf",), bucket_counts
+            ):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(key, (('le', str(bound)),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, description: str, callback: Callable[[], dict | float]
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def read(self) -> dict[LabelKey, float]:
+        values = self.callback()
+        if isinstance(values, dict):
+            return values
+        return {(): values}
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(key)} {value}"
+            for key, value in self.read().items()
+        ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, description))
+
+    def histogram(
+        self, name: str, description: str, buckets: tuple | None = None
+    ) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, description, buckets))
+
+    def gauge(
+        self, name: str, description: str, callback: Callable[[], dict | float]
+    ) -> Gauge:
+        # Gauges are re-registered by reloaded code, so the newest callback wins.
+        gauge = self.metrics[name] = Gauge(name, description, callback)
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9108) -> web.AppRunner:
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+registry = Registry()
+
+command_seconds = registry.histogram(
+    "djissu_command_seconds", "Time spent running a command."
+)
+search_total = registry.counter(
+    "djissu_search_total", "Track searches by search cache outcome."
+)
+search_seconds = registry.histogram(
+    "djissu_search_seconds", "Time spent waiting on Lavalink track searches."
+)
+announcement_seconds = registry.histogram(
+    "djissu_announcement_seconds", "Time spent sending now-playing announcements."
+)
+announcements_total = registry.counter(
+    "djissu_announcements_total", "Now-playing announcements by outcome."
+)
+track_gap_seconds = registry.histogram(
+    "djissu_track_gap_seconds", "Time between a track ending and the next starting."
+)
@@ -1,50 +1,351 @@
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import param
+from discord import app_commands
 import discord
 import os
 import wavelink
 from issutilities import craft
-import aiohttp
+from players import (
+    GuildStates,
+    VoiceOccupancy,
+    Player,
+    CompactTrack,
+    deep_sizeof,
+    decode_tracks,
+    requester_of,
+    with_requester,
+)
+from snapshots import SnapshotStore
+from caches import SearchCache, ArtworkCache
+from announcements import AnnouncementDispatcher
+from history import PlayHistory
+import metrics
+import io
 import math
 import asyncio
+import contextlib
 import re
 import datetime
+import time
 import traceback
 
 name = (os.path.basename(__file__)).replace(".py", "")
 
 
 class CogOld(commands.Cog, name=name):
+    # Only these bring back a queue saved before a restart; the rest never join voice for it.
+    RESTORING_COMMANDS = {"play", "connect", "queue", "now_playing"}
+    # These throw the saved queue away, as they would have done to the live one.
+    DISCARDING_COMMANDS = {"disconnect", "clear"}
+
     def __init__(self, bot):
         self.bot = bot
-        self.preferred_channel = [None, False, True]
         self.modes = ["sc", "spt", "yt", "direct_mode", "soundcloud", "spt", "youtube"]
-        self.blacklist = [803579319003512833]
-        self.alone = []
+
+        # Left on the bot by the instance this one replaces when the extension is reloaded.
+        self.handoff: dict = self.bot.cog_states.pop(name, {})
+        self.states: GuildStates = self.handoff.get("states", GuildStates())
+        self.occupancy: VoiceOccupancy = self.handoff.get(
+            "occupancy", VoiceOccupancy(self.bot.user.id if self.bot.user else None)
+        )
+        self.blacklist: list[int] = self.handoff.get("blacklist", [803579319003512833])
+        self.search_cache: SearchCache = self.handoff.get(
+            "search_cache", SearchCache(**self.bot.settings.get("search_cache", {}))
+        )
+        self.artwork_cache: ArtworkCache = self.handoff.get(
+            "artwork_cache", ArtworkCache(**self.bot.settings.get("artwork_cache", {}))
+        )
+        self.announcements: AnnouncementDispatcher = self.handoff.get(
+            "announcements",
+            AnnouncementDispatcher(**self.bot.settings.get("announcements", {})),
+        )
+
+        snapshot_settings = self.bot.settings.get("snapshots", {})
+        shard_ids = getattr(self.bot, "shard_ids", None)
+        self.snapshots = (
+            SnapshotStore(
+                f"queue_snapshot.{shard_ids[0]}-{shard_ids[-1]}"
+                if shard_ids
+                else "queue_snapshot",
+                snapshot_settings.get("max_age", 24 * 60 * 60),
+            )
+            if snapshot_settings.get("enabled", True)
+            else None
+        )
+        self.snapshot_loop = tasks.loop(seconds=snapshot_settings.get("interval", 60))(
+            self.save_snapshot
+        )
+        self.pending_restores: dict[int, dict] = self.handoff.get("pending_restores", {})
+        self.restoring: dict[int, asyncio.Task] = self.handoff.get("restoring", {})
+
+        history_settings = self.bot.settings.get("play_history", {})
+        self.history: PlayHistory | None = self.handoff.get("history") or (
+            PlayHistory(
+                history_settings.get("name", "play_history"),
+                history_settings.get("max_suggestions", 25),
+            )
+            if history_settings.get("enabled", True)
+            else None
+        )
+        self.history_loop = (
+            tasks.loop(seconds=history_settings.get("flush_interval", 30))(
+                self.history.flush
+            )
+            if self.history
+            else None
+        )
+
+        reaper_settings = self.bot.settings.get("idle_reaper", {})
+        self.idle_timeouts = {
+            "alone": reaper_settings.get("alone_timeout", 60),
+            "paused": reaper_settings.get("paused_timeout", 15 * 60),
+            # Finished players stay connected this long so a follow-up play skips the reconnect.
+            "idle": reaper_settings.get("linger", 2 * 60),
+        }
+        self.idle_reaper = tasks.loop(seconds=reaper_settings.get("interval", 15))(
+            self.reap_idle_players
+        )
+
+    async def cog_load(self):
+        self.idle_reaper.start()
+        if self.history_loop:
+            self.history_loop.start()
+
+        handoff, self.handoff = self.handoff, {}
+        if not self.snapshots:
+            return
+
+        if "pending_restores" not in handoff:
+            records = await asyncio.to_thread(self.snapshots.load)
+            # Guilds that are still connected (e.g. the extension was unloaded) keep their live queue.
+            self.pending_restores = {
+                guild_id: record
+                for guild_id, record in records.items()
+                if not (guild := self.bot.get_guild(guild_id)) or not guild.voice_client
+            }
+        self.snapshot_loop.start()
+
+    async def cog_unload(self):
+        self.idle_reaper.cancel()
+        if self.history_loop:
+            self.history_loop.cancel()
+        if self.snapshots:
+            self.snapshot_loop.cancel()
+
+        if not self.bot.closing:
+            self.bot.cog_states[name] = {
+                "states": self.states,
+                "occupancy": self.occupancy,
+                "blacklist": self.blacklist,
+                "search_cache": self.search_cache,
+                "artwork_cache": self.artwork_cache,
+                "announcements": self.announcements,
+                "pending_restores": self.pending_restores,
+                "restoring": self.restoring,
+                "history": self.history,
+            }
+            return
+
+        self.announcements.close()
+        if self.history:
+            self.history.close()
+        if self.snapshots:
+            await self.save_snapshot()
+
+    async def save_snapshot(self) -> None:
+        records = dict(self.pending_restores)
+        for vc in self.bot.voice_clients:
+            if isinstance(vc, Player) and (
+                record := SnapshotStore.capture(vc, self.states.get(vc.guild.id))
+            ):
+                records[record["guild"]] = record
+
+        try:
+            await self.snapshots.save(list(records.values()))
+        except Exception as exc:
+            self.bot.logger.error("Could not save the queue snapshot", exc_info=exc)
+
+    async def reap_idle_players(self) -> None:
+        now = time.monotonic()
+
+        for vc in list(self.bot.voice_clients):
+            if not isinstance(vc, Player) or not vc.channel:
+                continue
+
+            # Re-counted from the cache here so missed gateway events cannot leave a player stuck.
+            if not self.occupancy.track(vc.channel)[1]:
+                reason = "alone"
+            elif vc.paused:
+                reason = "paused"
+            elif not vc.current:
+                reason = "idle"
+            else:
+                reason = None
+
+            if reason != vc.idle_reason:
+                vc.idle_reason, vc.idle_since = reason, now
+            if not reason or now - vc.idle_since < self.idle_timeouts[reason]:
+                continue
+
+            # Evicted here rather than on the voice state update, so the notice below
+            # is flushed instead of cancelled along with the channel's announcer.
+            state = self.states.evict(vc.guild.id)
+            channel = vc.channel
+            try:
+                vc.cleanup()
+                await vc.disconnect()
+            except Exception as exc:
+                self.bot.logger.error("Could not disconnect an idle player", exc_info=exc)
+                if state:
+                    self.states[vc.guild.id] = state
+                continue
+            self.occupancy.untrack(channel.id)
+
+            if state and state.channel:
+                if state.announce:
+                    notice = f"💤 Left `{channel.name}` after being {reason} for {craft.formatted_time(round(now - vc.idle_since))}."
+                    self.announcements.submit(
+                        state.channel, lambda send, notice=notice: send(content=notice)
+                    )
+                self.announcements.forget(state.channel.id, flush=True)
+
+    async def restore_guild(self, ctx) -> None:
+        guild_id = ctx.guild.id
+        if not (task := self.restoring.get(guild_id)):
+            task = self.restoring[guild_id] = asyncio.create_task(
+                self.restore_player(ctx, self.pending_restores.pop(guild_id))
+            )
+            task.add_done_callback(lambda _: self.restoring.pop(guild_id, None))
+
+        try:
+            await asyncio.shield(task)
+        except Exception as exc:
+            self.bot.logger.error("Could not restore a queue snapshot", exc_info=exc)
+
+    async def restore_player(self, ctx, record: dict) -> None:
+        channel = ctx.guild.get_channel(record["voice_channel"])
+        if not (channel and any(not member.bot for member in channel.members)):
+            channel = ctx.author.voice.channel if ctx.author.voice else None
+        if not channel:
+            # Nobody to play to yet; try again on the guild's next playback command.
+            self.pending_restores[ctx.guild.id] = record
+            return
+
+        vc: Player = ctx.voice_client or await channel.connect(
+            cls=Player(nodes=[self.bot.nodes.best_node()]), self_deaf=True
+        )
+
+        state = self.states[ctx.guild.id]
+        self.move_announcements(
+            state, ctx.guild.get_channel(record["announce_channel"] or 0) or state.channel
+        )
+        state.sticky, state.announce = record["sticky"], record["announce"]
+
+        current = record["current"] if not vc.current else None
+        tracks = await decode_tracks(vc.node, ([current] if current else []) + record["queue"])
+        if current:
+            current = with_requester(
+                wavelink.Playable(tracks[0]), record.get("current_requester")
+            )
+            tracks = tracks[1:]
+
+        vc.queue.mode = SnapshotStore.queue_mode(record)
+        # Snapshots from before requesters were recorded have no "requesters" list.
+        requesters = record.get("requesters") or [None] * len(record["queue"])
+        await vc.queue.put_wait(
+            [
+                CompactTrack.from_payload(data, requester)
+                for data, requester in zip(tracks, requesters)
+            ]
+        )
+
+        if current:
+            async with vc.starting:
+                await vc.play(current, start=record["position"], paused=record["paused"])
+        elif vc.queue:
+            await vc.play_next()
+
+        await ctx.reply(
+            f"♻ Restored {len(tracks) + bool(current)} track(s) from before the restart!"
+        )
+
+    def move_announcements(self, state, channel) -> None:
+        # The old channel's announcer would otherwise stay queued until disconnect.
+        if state.channel and state.channel != channel:
+            self.announcements.forget(state.channel.id)
+        state.channel = channel
 
     async def cog_before_invoke(self, ctx):
-        if not self.preferred_channel[1] and self.preferred_channel[0] != ctx.channel:
-            self.preferred_channel[0] = ctx.channel
+        ctx.started_at = time.perf_counter()
+        if not ctx.guild:
+            return
+
+        if ctx.command.name in self.RESTORING_COMMANDS and (
+            ctx.guild.id in self.pending_restores or ctx.guild.id in self.restoring
+        ):
+            await self.restore_guild(ctx)
+        elif ctx.command.name in self.DISCARDING_COMMANDS:
+            self.pending_restores.pop(ctx.guild.id, None)
+
+        # State is only created once the bot joins; other commands just follow it.
+        state = self.states.get(ctx.guild.id)
+        if state and not state.sticky and state.channel != ctx.channel:
+            self.move_announcements(state, ctx.channel)
+
+    async def cog_after_invoke(self, ctx):
+        if started_at := getattr(ctx, "started_at", None):
+            metrics.command_seconds.observe(
+                time.perf_counter() - started_at, command=ctx.command.qualified_name
+            )
 
     async def cog_check(self, ctx):
         return ctx.author.id not in self.blacklist
 
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id not in self.blacklist
+
     @commands.command(aliases=["latency", "test", "ing"])
     async def ping(self, ctx):
         """\n    Tests the bot connection."""
-        bot_latency = round(self.bot.latency * 1000, 2)
+        shard = (
+            self.bot.get_shard(ctx.guild.shard_id)
+            if ctx.guild and isinstance(self.bot, commands.AutoShardedBot)
+            else None
+        )
+        bot_latency = round((shard.latency if shard else self.bot.latency) * 1000, 2)
+        shard_latencies = (
+            "- Shard latencies: "
+            + ", ".join(
+                f"#{shard_id}: {round(latency * 1000, 2)}ms"
+                for shard_id, latency in self.bot.latencies
+            )
+            + "\n"
+            if shard
+            else ""
+        )
         vc: wavelink.Player = ctx.voice_client
         vc_latency = round(vc.ping, 2) if vc else "(N/A)"
+        track_gap = (
+            f"- Track gap: {round(vc.last_gap, 2)}ms (avg. {round(vc.average_gap, 2)}ms)\n"
+            if vc and getattr(vc, "last_gap", None) is not None
+            else ""
+        )
 
         await ctx.reply(
-            f"🏓 Pong!\n- Bot latency: {bot_latency}ms\n- VC latency: {vc_latency}ms\n{'*If VC latency is <=0ms, try playing something*' if vc_latency == 0 else ''}"
+            f"🏓 Pong!\n- Bot latency: {bot_latency}ms{f' (shard #{shard.id})' if shard else ''}\n{shard_latencies}- VC latency: {vc_latency}ms\n{track_gap}{'*If VC latency is <=0ms, try playing something*' if vc_latency == 0 else ''}"
         )
 
     @commands.command(aliases=["roblem", "problem"])
     @commands.cooldown(rate=1, per=120)
     async def report(self, ctx):
         """\n    Creates a connection/latency report to issu."""
+        # Members are not chunked or cached by default, so the owner usually has to be fetched.
         owner = self.bot.get_user(self.bot.owner_id)
+        if not owner:
+            try:
+                owner = await self.bot.fetch_user(self.bot.owner_id)
+            except discord.HTTPException:
+                owner = None
         if owner:
             vc: wavelink.Player = ctx.voice_client
             current_node = vc.node
@@ -67,6 +368,66 @@ class CogOld(commands.Cog, name=name):
         except Exception as exc:
             print(exc)
 
+    @commands.is_owner()
+    @commands.command(aliases=["sync"])
+    async def sync_commands(self, ctx):
+        """\n    (OWNER ONLY) Publishes the slash commands to Discord."""
+        synced = await self.bot.tree.sync()
+        await ctx.reply(f"🔄 Synced {len(synced)} slash command(s)!")
+
+    @commands.is_owner()
+    @commands.command(aliases=["mem"])
+    async def memory(self, ctx):
+        """\n    (OWNER ONLY) Reports the memory used by queued tracks."""
+        entries = [
+            entry
+            for vc in self.bot.voice_clients
+            for entry in getattr(vc, "queue", ())
+        ]
+        if not entries:
+            return await ctx.reply("There is no queue!")
+
+        compact = sum(isinstance(entry, CompactTrack) for entry in entries)
+        size = sum(deep_sizeof(entry) for entry in entries)
+
+        await ctx.reply(
+            f"🧠 {len(entries)} queued track(s) across {len(self.bot.voice_clients)} player(s)\n- Compact: {compact} | Full: {len(entries) - compact}\n- Estimated size: {size / 1024:.1f} KiB ({size // len(entries)} bytes per track)"
+        )
+
+    @commands.is_owner()
+    @commands.command(aliases=["metrics"])
+    async def stats(self, ctx):
+        """\n    (OWNER ONLY) Shows command, search and playback latency statistics."""
+        latency = lambda histogram, **labels: (
+            f"{histogram.count(**labels)} | p50 ≤{histogram.quantile(0.5, **labels) * 1000:g}ms | p99 ≤{histogram.quantile(0.99, **labels) * 1000:g}ms"
+        )
+        commands_used = sorted(
+            (dict(key)["command"] for key in metrics.command_seconds.values),
+            key=lambda command: -metrics.command_seconds.count(command=command),
+        )
+        nodes = metrics.registry.metrics["djissu_node_players"].read()
+
+        lines = [
+            "```📊 Stats```",
+            "__Commands__",
+            *[
+                f"- `{command}`: {latency(metrics.command_seconds, command=command)}"
+                for command in commands_used[:10]
+            ],
+            "__Searches__",
+            f"- Cache: {metrics.search_total.get(outcome='hit'):g} hit(s), {metrics.search_total.get(outcome='coalesced'):g} coalesced, {metrics.search_total.get(outcome='miss'):g} miss(es)",
+            f"- Lavalink: {latency(metrics.search_seconds)}",
+            "__Playback__",
+            f"- Announcements: {latency(metrics.announcement_seconds)} ({metrics.announcements_total.get(outcome='sent'):g} sent, {metrics.announcements_total.get(outcome='edited'):g} edited, {metrics.announcements_total.get(outcome='coalesced'):g} coalesced)",
+            f"- Track gaps: {latency(metrics.track_gap_seconds)}",
+            f"- Queued tracks: {metrics.registry.metrics['djissu_queued_tracks'].read()[()]}",
+            *[
+                f"- Node `{dict(key)['node']}`: {players} player(s)"
+                for key, players in nodes.items()
+            ],
+        ]
+        await ctx.reply("\n".join(lines))
+
     async def join_channel(
         self, ctx: commands.Context, channel: discord.VoiceChannel = None
     ) -> discord.Message:
@@ -76,18 +437,24 @@ class CogOld(commands.Cog, name=name):
             await vc.move_to(channel)
             return await ctx.reply(f"➡ Switching to `{channel.name}`!")
 
-        await channel.connect(cls=wavelink.Player, self_deaf=True)
+        await channel.connect(
+            cls=Player(nodes=[self.bot.nodes.best_node()]), self_deaf=True
+        )
+        state = self.states[ctx.guild.id]
+        if not state.sticky:
+            self.move_announcements(state, ctx.channel)
         return await ctx.reply(f"🔊 Joining `{channel.name}`!")
 
     async def switch_preferred_channel(
         self, ctx: commands.Context, channel: discord.TextChannel = None, also_announce: str = None) -> discord.Message:
-        self.preferred_channel[0] = channel
-        old_preferred_setting = self.preferred_channel[1]
-        self.preferred_channel[1] = bool(also_announce) or self.preferred_channel[1]
-        changed = old_preferred_setting == self.preferred_channel[1]
+        state = self.states[ctx.guild.id]
+        self.move_announcements(state, channel)
+        old_preferred_setting = state.sticky
+        state.sticky = bool(also_announce) or state.sticky
+        changed = old_preferred_setting == state.sticky
 
         return await ctx.reply(
-            f"📝 Changed preferred music announcement channel to `{channel.name}`{" and will resume announcing now!" if changed and self.preferred_channel[1] else "."}"
+            f"📝 Changed preferred music announcement channel to `{channel.name}`{" and will resume announcing now!" if changed and state.sticky else "."}"
         )
 
     async def determine_channel_handling(
@@ -123,7 +490,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -169,7 +536,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -194,26 +561,28 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
             )
 
         if vc:
-            self.preferred_channel[2] = (
+            state = self.states[ctx.guild.id]
+            value = (value or "").lower()
+            state.announce = (
                 True
-                if value.lower() == "true"
+                if value == "true"
                 else False
-                if value.lower() == "false"
-                else not self.preferred_channel[2]
+                if value == "false"
+                else not state.announce
             )
-            if not self.preferred_channel[2]:
+            if state.announce:
                 return await ctx.reply(
-                    f"✉ Music announcements to {self.preferred_channel[0]} are now resumed."
+                    f"✉ Music announcements to {state.channel} are now resumed."
                 )
             return await ctx.reply(
-                f"🤫 Music announcements to {self.preferred_channel[0]} are now silenced."
+                f"🤫 Music announcements to {state.channel} are now silenced."
             )
 
         await ctx.message.add_reaction("❌")
@@ -232,12 +601,60 @@ class CogOld(commands.Cog, name=name):
         *,
         search: str
         | None = param(
-            description="\n    (opt.) [string] The search term/phrase or link to queue.",
+            description="\n    (opt.) [string] The search term/phrase or link to queue. Separate multiple searches with new lines or `;`, or attach a .txt file.",
             default=None,
             displayed_default=None,
         ),
     ) -> None:
         """\n    Searches for and plays a track. Joins or moves to your voice channel if the bot isn't in one or is alone, if needed."""
+        await self.play_query(ctx, search)
+
+    @app_commands.command(name="play")
+    @app_commands.guild_only()
+    @app_commands.describe(
+        search="The search term/phrase or link to queue, or a track played here before."
+    )
+    async def play_app_command(self, interaction: discord.Interaction, search: str):
+        """Searches for and plays a track, suggesting ones this server has played."""
+        # Joining and loading can take longer than the initial response window.
+        await interaction.response.defer()
+        ctx = await commands.Context.from_interaction(interaction)
+        await self.cog_before_invoke(ctx)
+
+        picked = self.history.get(ctx.guild.id, search) if self.history else None
+        await self.play_query(ctx, None if picked else search, picked)
+        await self.cog_after_invoke(ctx)
+
+    @play_app_command.autocomplete("search")
+    async def play_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> list[app_commands.Choice[str]]:
+        if not self.history or not interaction.guild_id:
+            return []
+        return [
+            app_commands.Choice(
+                name=f"{title} - {author}"[:100],
+                value=f"{PlayHistory.PICK_PREFIX}{track_id}",
+            )
+            for track_id, title, author in self.history.suggest(
+                interaction.guild_id, current
+            )
+        ]
+
+    async def cog_app_command_error(
+        self, interaction: discord.Interaction, error: app_commands.AppCommandError
+    ):
+        self.bot.logger.error("An app command failed", exc_info=error)
+        send = (
+            interaction.followup.send
+            if interaction.response.is_done()
+            else interaction.response.send_message
+        )
+        await send(f"❌ Error occurred. <@{self.bot.owner_id}>\nError: `{error}`")
+
+    async def play_query(
+        self, ctx, search: str | None, picked: wavelink.Playable | None = None
+    ) -> None:
         vc: wavelink.Player = ctx.voice_client
 
         if not ctx.author.voice:
@@ -245,7 +662,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -253,7 +670,7 @@ class CogOld(commands.Cog, name=name):
 
         channel = (
             vc.channel
-            if vc and len(vc.channel.members) >= 2
+            if vc and self.occupancy.members(vc.channel) >= 2
             else ctx.author.voice.channel
         )
 
@@ -266,7 +683,9 @@ class CogOld(commands.Cog, name=name):
         else:
             message = None
 
-        if not search:
+        queries, ignored = await self.collect_queries(ctx, search)
+
+        if not queries and not picked:
             if vc.paused:
                 return await self.resume_track(ctx)
 
@@ -282,16 +701,32 @@ class CogOld(commands.Cog, name=name):
             else await message.edit(content=f"{message.content}\n\n⏳ Loading...")
         )
 
-        Tracks: wavelink.Search = await wavelink.Playable.search(search)
+        if len(queries) > 1:
+            return await self.bulk_play(vc, message, queries, ctx.author.id, ignored)
 
-        if Tracks is None:
+        # Suggestions picked from the play history are already resolved.
+        Tracks: wavelink.Search = (
+            [picked] if picked else await self.search_cache.search(queries[0])
+        )
+
+        if not Tracks:
             return await message.edit(
                 content=f"{message.content}\n\n❌ Something wrong happened! Could not complete search.\n\n*This feature is in beta. Send all suggestions to @issu*"
             )
         elif type(Tracks) == list:
             playable_object = Tracks[0]
+            entries = (
+                CompactTrack.from_playable(playable_object, ctx.author.id)
+                if vc.current
+                else with_requester(playable_object, ctx.author.id)
+            )
         elif type(Tracks) == wavelink.Playlist:
             playable_object = Tracks
+            entries = [
+                CompactTrack.from_playable(track, ctx.author.id) for track in Tracks
+            ]
+            if not vc.current:
+                entries[0] = with_requester(Tracks[0], ctx.author.id)
         else:
             return await message.edit(
                 content=f"{message.content}\n\n❌ Something wrong happened! You actually aren't supposed to see this!\n\n*This feature is in beta. Send all suggestions to @issu*"
@@ -301,14 +736,104 @@ class CogOld(commands.Cog, name=name):
             await message.edit(
                 content=f"{message.content}\n\n📃 Queued `{playable_object}` starting at __Position #{len(vc.queue)+1}__"
             )
-            return await vc.queue.put_wait(playable_object)
+            return await vc.queue.put_wait(entries)
         else:
             await message.edit(
                 content=f"{message.content}\n\n📃 Queued `{playable_object}` starting at __Position #{len(vc.queue)}__"
             )
-            await vc.queue.put_wait(playable_object)
+            await vc.queue.put_wait(entries)
 
-            return await vc.play(vc.queue.get())
+            return await vc.play_next()
+
+    async def collect_queries(self, ctx, search: str | None) -> tuple[list[str], int]:
+        """The searches to run, and how many were left out for going over `max_queries`."""
+        text = search or ""
+
+        for attachment in ctx.message.attachments:
+            if attachment.size <= 64 * 1024 and (
+                attachment.filename.endswith(".txt")
+                or (attachment.content_type or "").startswith("text/")
+            ):
+                text += "\n" + (await attachment.read()).decode("utf-8", "ignore")
+
+        queries = [query.strip() for query in re.split(r"[\n;]", text)]
+        queries = [query for query in queries if query]
+        max_queries = self.bot.settings.get("bulk_play", {}).get("max_queries", 100)
+        return queries[:max_queries], max(len(queries) - max_queries, 0)
+
+    async def bulk_play(
+        self,
+        vc: wavelink.Player,
+        message: discord.Message,
+        queries: list[str],
+        requester: int | None = None,
+        ignored: int = 0,
+    ) -> discord.Message:
+        settings = self.bot.settings.get("bulk_play", {})
+        semaphore = asyncio.Semaphore(
+            max(len(self.bot.nodes.available_nodes()), 1)
+            * settings.get("concurrency_per_node", 4)
+        )
+        header = message.content.removesuffix("⏳ Loading...")
+        resolved = 0
+
+        async def resolve(query: str) -> "wavelink.Search | None":
+            nonlocal resolved
+            async with semaphore:
+                try:
+                    return await self.search_cache.search(query)
+                except Exception:
+                    return None
+                finally:
+                    resolved += 1
+
+        async def report_progress() -> None:
+            while True:
+                await asyncio.sleep(2)
+                try:
+                    await message.edit(
+                        content=f"{header}⏳ Loading... ({resolved}/{len(queries)})"
+                    )
+                except discord.HTTPException:
+                    # Most likely deleted; the searches carry on without progress updates.
+                    return
+
+        progress = asyncio.create_task(report_progress())
+        try:
+            results = await asyncio.gather(*[resolve(query) for query in queries])
+        finally:
+            progress.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await progress
+
+        entries = []
+        for Tracks in results:
+            if type(Tracks) == list and Tracks:
+                entries.append(CompactTrack.from_playable(Tracks[0], requester))
+            elif type(Tracks) == wavelink.Playlist:
+                entries.extend(
+                    CompactTrack.from_playable(track, requester) for track in Tracks
+                )
+        failed = sum(not Tracks for Tracks in results)
+
+        if not entries:
+            return await message.edit(
+                content=f"{header}❌ Something wrong happened! Could not complete any of the {len(queries)} searches."
+            )
+
+        position = len(vc.queue) + (1 if vc.current else 0)
+        await vc.queue.put_wait(entries)
+        skipped = (
+            f"\n⚠ {ignored} more search(es) were ignored; only {len(queries)} can be queued at once."
+            if ignored
+            else ""
+        )
+        message = await message.edit(
+            content=f"{header}📃 Queued {len(entries)} track(s) from {len(queries)} searches starting at __Position #{position}__{f' ({failed} failed)' if failed else ''}{skipped}"
+        )
+
+        await vc.play_next()
+        return message
 
     @commands.command()
     async def pause(
@@ -330,7 +855,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -367,15 +892,17 @@ class CogOld(commands.Cog, name=name):
 
         if vc and (
             (not ctx.author.voice or ctx.author.voice.channel != vc.channel)
-            and len(vc.channel.members) >= 2
+            and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
             )
 
         if vc:
+            channel = vc.channel
             vc.cleanup()
             await vc.disconnect()
+            self.occupancy.untrack(channel.id)
             return await ctx.message.add_reaction("👋")
         else:
             await ctx.message.add_reaction("👻")
@@ -391,24 +918,60 @@ class CogOld(commands.Cog, name=name):
         now_playing = f"▶ Now Playing: `{vc.current if vc.current else 'Unknown'}` by **{vc.current.author if vc.current else 'Unknown'}** [{craft.formatted_time(current_timestamp) if current_timestamp else '0:00'} / {craft.formatted_time(duration_timestamp) if duration_timestamp else '0:00'}]"
         return now_playing
 
-    async def display_message(self, ctx=None, vc: wavelink.Player = None) -> None:
-        now_playing = self.get_nowplaying(vc)
+    async def build_announcement(
+        self, now_playing: str, track: wavelink.Playable, mode: str
+    ) -> dict:
+        thumb_url = track.artwork or None
+
+        if not thumb_url:
+            return {"content": now_playing}
+        elif mode == "embed":
+            return {"embed": craft.embed(description=now_playing, image=thumb_url)}
+
+        artwork = await self.artwork_cache.fetch(thumb_url, self.bot.http_session)
+        return {
+            "content": now_playing,
+            "file": discord.File(io.BytesIO(artwork), "image.png") if artwork else None,
+        }
+
+    @classmethod
+    def embed_rejected(self, exc: discord.HTTPException, channel) -> bool:
+        # Invalid Form Body about the embed, or Missing Permissions for want of Embed Links.
+        if exc.status == 400:
+            return exc.code == 50035 and "embed" in exc.text.lower()
+        return (
+            exc.status == 403
+            and exc.code == 50013
+            and not channel.permissions_for(channel.guild.me).embed_links
+        )
 
+    async def send_now_playing(self, send, vc: wavelink.Player, channel) -> None:
+        now_playing = self.get_nowplaying(vc)
         track = vc.current
+        mode = self.bot.settings.get("announcement_mode", "file")
 
-        async with aiohttp.ClientSession() as session:
-            thumb_url = track.artwork or None
-            _file = await craft.file_from_url(thumb_url, session) if thumb_url else None
-            if ctx:
-                await ctx.reply(
-                    content=now_playing,
-                    file=_file,
-                )
-            elif self.preferred_channel[2]:
-                await self.preferred_channel[0].send(
-                    content=now_playing,
-                    file=_file,
-                )
+        try:
+            await send(**await self.build_announcement(now_playing, track, mode))
+        except discord.HTTPException as exc:
+            # Anything other than the embed itself being refused would just fail again.
+            if mode == "file" or not self.embed_rejected(exc, channel):
+                raise
+            await send(**await self.build_announcement(now_playing, track, "file"))
+
+    async def display_message(self, ctx=None, vc: wavelink.Player = None) -> None:
+        if ctx:
+            return await self.send_now_playing(ctx.reply, vc, ctx.channel)
+
+        state = self.states.get(vc.guild.id)
+        if not (state and state.announce and state.channel):
+            return
+
+        async def announce(send) -> None:
+            # Built when the burst settles, so it shows whatever is playing by then.
+            if vc.current:
+                await self.send_now_playing(send, vc, state.channel)
+
+        self.announcements.submit(state.channel, announce)
 
     @commands.command(aliases=["np", "current", "nowplaying"])
     async def now_playing(self, ctx):
@@ -434,42 +997,40 @@ class CogOld(commands.Cog, name=name):
             return await ctx.reply("There is no queue!")
 
         now_playing = f"{self.get_nowplaying(vc)}\n----------\n"
-        if len(vc.queue) > 1:
-            full_queue = [
-                f"[#{i+1}] `{vc.queue[i]}` by **{vc.queue[i].author}** [{craft.formatted_time(round(math.floor(vc.queue[i].length / 1000)))}]"
-                for i in range(len(vc.queue))
-            ]
-
-            queue_pages = [
-                full_queue[x : x + 10] for x in range(0, len(full_queue), 10)
-            ]
-
-            if page_number > len(queue_pages):
-                page_number = len(queue_pages)
-            elif page_number <= 0:
-                page_number = 1
-            queue_content = "\n".join(queue_pages[page_number - 1])
+        queue_length = len(vc.queue)
+        if queue_length:
+            page_count = math.ceil(queue_length / 10)
+            page_number = min(max(page_number, 1), page_count)
+            start = (page_number - 1) * 10
+
+            queue_content = "\n".join(
+                f"[#{index}] `{track}` by **{track.author}** [{craft.formatted_time(round(math.floor(track.length / 1000)))}]"
+                for index, track in enumerate(
+                    vc.queue[start : start + 10], start=start + 1
+                )
+            )
         else:
             queue_content = ""
-            page_number = "0"
-            queue_pages = ""
+            page_number = 0
+            page_count = 0
 
         await ctx.reply(
-            f"```Queue```----------\n{now_playing}{queue_content}\n\n*Page {page_number} of {len(queue_pages)}*"
+            f"```Queue```----------\n{now_playing}{queue_content}\n\n*Page {page_number} of {page_count}* | {queue_length} track(s), {craft.formatted_time(vc.queue.total_length // 1000)} total"
         )
 
     @commands.command(aliases=["r", "c", "remove", "cut"])
     async def clear(
         self,
         ctx,
+        *,
         entry: str
         | None = param(
-            description="\n    [int/string] {1-MAX} The queue entry to remove. Could either be an entry number or keyword.\n     --> KEYWORDS: [all/start/end]",
+            description="\n    [int/string] {1-MAX} The queue entry to remove. Could either be an entry number, a range or keyword.\n     --> KEYWORDS: [all/start/end/duplicates/mine]\n     --> [5-50], [@user] or [artist <name>] remove every matching track at once",
             default=None,
             displayed_default=None,
         ),
     ):
-        """\n    Removes the given track entry number, if possible. Does NOT skip the currently playing track."""
+        """\n    Removes the given track entry number or every matching track, if possible. Does NOT skip the currently playing track."""
         vc: wavelink.Player = ctx.voice_client
 
         if not ctx.author.voice:
@@ -477,7 +1038,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -486,27 +1047,192 @@ class CogOld(commands.Cog, name=name):
         if vc:
             if not entry:
                 return await ctx.reply(
-                    "- You can remove either [all] the tracks, the [start] or [end] of the queue, or any [entry number] on the queue."
+                    "- You can remove either [all] the tracks, the [start] or [end] of the queue, or any [entry number] on the queue.\n- You can also remove a range like [5-50], every track queued by [@user] or by [artist <name>], or the [duplicates]."
                 )
+
+            entry = entry.strip()
+            if removed := self.bulk_clear(ctx, vc, entry):
+                description, tracks = removed
+                if tracks is None:
+                    return await ctx.reply("❌ Please provide a valid entry range!")
+                if not tracks:
+                    return await ctx.reply(f"❓ No queued tracks matched {entry}.")
+
+                length = sum(track.length for track in tracks) // 1000
+                return await ctx.reply(
+                    f"🗑 Removed {len(tracks)} track(s) {description} [{craft.formatted_time(length)}]."
+                )
+
             match (entry.lower()):
                 case "all" | "queue" | "q":
                     await ctx.reply(f"📃 Clearing queue.")
                     return vc.queue.clear()
                 case "start" | "beginning" | "begin" | "first" | "top":
-                    track = vc.queue.get()
+                    index = 1
                 case "end" | "last" | "bottom":
-                    track = vc.queue.pop()
+                    index = len(vc.queue)
                 case _:
                     try:
                         index = int(entry)
-                        track = vc.queue[index - 1]
-                        del vc.queue[index - 1]
                     except ValueError:
                         return await ctx.reply("❌ Please provide a valid entry number!")
 
+            if not 1 <= index <= len(vc.queue):
+                return await ctx.reply("❌ Please provide a valid entry number!")
+            track = vc.queue.pop(index - 1)
+
             return await ctx.reply(f"🗑 Removed `{track}` by **{track.author}**.")
         await ctx.message.add_reaction("❌")
 
+    def bulk_clear(
+        self, ctx, vc: wavelink.Player, entry: str
+    ) -> tuple[str, list | None] | None:
+        """Handles the forms of `clear` that remove many tracks, each in a single pass.
+
+        Returns what was matched and the removed tracks (None for a bad range), or
+        None if the entry is not a bulk form."""
+        if entry.lower() in ("duplicates", "duplicate", "dupes", "dups"):
+            return "that were duplicates", vc.queue.dedupe()
+
+        if match := re.fullmatch(r"(\d+)\s*-\s*(\d+)", entry):
+            first, last = sorted(map(int, match.groups()))
+            if first < 1 or last > len(vc.queue):
+                return f"#{first}-#{last}", None
+            return f"from #{first} to #{last}", vc.queue.remove_range(first - 1, last)
+
+        if match := re.fullmatch(r"<@!?(\d+)>|(me|mine)", entry, re.IGNORECASE):
+            user_id = ctx.author.id if match[2] else int(match[1])
+            return f"queued by <@{user_id}>", vc.queue.remove_where(
+                lambda track: requester_of(track) == user_id
+            )
+
+        if match := re.fullmatch(r"(?:artist|by)\s+(.+)", entry, re.IGNORECASE):
+            artist = match[1].casefold()
+            return f"by **{match[1]}**", vc.queue.remove_where(
+                lambda track: track.author.casefold() == artist
+            )
+
+        return None
+
+    @commands.command(aliases=["mv", "reorder", "bump"])
+    async def move_track(
+        self,
+        ctx,
+        entry: int = param(
+            description="\n    [int] {1-MAX} The queue entry to move.",
+        ),
+        position: int = param(
+            description="\n    (opt.) [int] {1-MAX} The position to move it to. Defaults to the top of the queue.",
+            default=1,
+            displayed_default=1,
+        ),
+    ):
+        """\n    Moves a queued track to another position in the queue."""
+        vc: wavelink.Player = ctx.voice_client
+
+        if not ctx.author.voice:
+            return await ctx.reply(
+                "🤓 Hey silly! You have to be in a VC to use the music bot :P"
+            )
+        elif vc and (
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
+        ):
+            return await ctx.reply(
+                f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
+            )
+
+        if vc:
+            if not (1 <= entry <= len(vc.queue) and 1 <= position <= len(vc.queue)):
+                return await ctx.reply("❌ Please provide a valid entry number!")
+
+            vc.queue.move(entry - 1, position - 1)
+            track = vc.queue[position - 1]
+            return await ctx.reply(
+                f"↕ Moved `{track}` by **{track.author}** to __Position #{position}__."
+            )
+        await ctx.message.add_reaction("❌")
+
+    @commands.command(aliases=["sw", "exchange"])
+    async def swap(
+        self,
+        ctx,
+        first: int = param(
+            description="\n    [int] {1-MAX} The first queue entry to swap.",
+        ),
+        second: int = param(
+            description="\n    [int] {1-MAX} The queue entry to swap it with.",
+        ),
+    ):
+        """\n    Swaps the positions of two queued tracks."""
+        vc: wavelink.Player = ctx.voice_client
+
+        if not ctx.author.voice:
+            return await ctx.reply(
+                "🤓 Hey silly! You have to be in a VC to use the music bot :P"
+            )
+        elif vc and (
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
+        ):
+            return await ctx.reply(
+                f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
+            )
+
+        if vc:
+            if not (1 <= first <= len(vc.queue) and 1 <= second <= len(vc.queue)):
+                return await ctx.reply("❌ Please provide a valid entry number!")
+
+            vc.queue.swap(first - 1, second - 1)
+            return await ctx.reply(
+                f"🔀 Swapped `{vc.queue[second - 1]}` (now #{second}) with `{vc.queue[first - 1]}` (now #{first})."
+            )
+        await ctx.message.add_reaction("❌")
+
+    @commands.command(aliases=["mix", "random", "randomize"])
+    async def shuffle(self, ctx):
+        """\n    Shuffles the queue. Does NOT change the currently playing track."""
+        vc: wavelink.Player = ctx.voice_client
+
+        if not ctx.author.voice:
+            return await ctx.reply(
+                "🤓 Hey silly! You have to be in a VC to use the music bot :P"
+            )
+        elif vc and (
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
+        ):
+            return await ctx.reply(
+                f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
+            )
+
+        if vc and vc.queue:
+            vc.queue.shuffle()
+            return await ctx.reply(f"🔀 Shuffled {len(vc.queue)} track(s)!")
+        await ctx.message.add_reaction("❌")
+
+    @commands.command(aliases=["dedup", "unique", "duplicates"])
+    async def dedupe(self, ctx):
+        """\n    Removes repeated tracks from the queue, keeping the first of each."""
+        vc: wavelink.Player = ctx.voice_client
+
+        if not ctx.author.voice:
+            return await ctx.reply(
+                "🤓 Hey silly! You have to be in a VC to use the music bot :P"
+            )
+        elif vc and (
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
+        ):
+            return await ctx.reply(
+                f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
+            )
+
+        if vc:
+            removed = len(vc.queue.dedupe())
+            return await ctx.reply(
+                f"🧹 Removed {removed} duplicate track(s)."
+                if removed
+                else "✅ There are no duplicate tracks in the queue!"
+            )
+        await ctx.message.add_reaction("❌")
+
     @commands.command(aliases=["next", "pass", "s"])
     async def skip(self, ctx):
         """\n    Skips the currently playing song, if possible."""
@@ -517,7 +1243,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -550,7 +1276,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -613,7 +1339,7 @@ class CogOld(commands.Cog, name=name):
                 "🤓 Hey silly! You have to be in a VC to use the music bot :P"
             )
         elif vc and (
-            ctx.author.voice.channel != vc.channel and len(vc.channel.members) >= 2
+            ctx.author.voice.channel != vc.channel and self.occupancy.members(vc.channel) >= 2
         ):
             return await ctx.reply(
                 f"❌ The bot is currently in use, please join me in {vc.channel.mention} instead!"
@@ -653,29 +1379,56 @@ class CogOld(commands.Cog, name=name):
 
     @commands.Cog.listener()
     async def on_wavelink_track_start(self, payload: wavelink.TrackStartEventPayload):
-        player = payload.player
-        return await self.display_message(None, player)
+        player: Player = payload.player
+        player.record_gap()
+        if self.history:
+            self.history.record(player.guild.id, payload.track)
+
+        await self.display_message(None, player)
+        await self.prefetch_next(player)
+
+    async def prefetch_next(self, player: Player) -> None:
+        try:
+            if not (track := await player.prefetch()):
+                return
+
+            if (
+                track.artwork
+                and self.bot.settings.get("announcement_mode", "file") == "file"
+            ):
+                await self.artwork_cache.fetch(track.artwork, self.bot.http_session)
+        except Exception as exc:
+            self.bot.logger.error("Could not prefetch the next track", exc_info=exc)
 
     @commands.Cog.listener()
     async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
+        payload.player.ended_at = time.perf_counter()
         try:
-            next_song: wavelink.Playable = payload.player.queue.get()
-            if next_song:
-                await payload.player.play(next_song)
+            await payload.player.play_next()
         except wavelink.exceptions.QueueEmpty:
-            if self.preferred_channel[2]:
-                return await self.preferred_channel[0].send("⏹ Queue ended!")
+            payload.player.ended_at = None
+            state = self.states.get(payload.player.guild.id)
+            if state and state.announce and state.channel:
+                self.announcements.submit(
+                    state.channel, lambda send: send(content="⏹ Queue ended!")
+                )
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        if member.id == self.bot.user.id and not after.channel:
-            self.preferred_channel = [None, False, True]
+        # The cog can load before login, when the bot's own id is not known yet.
+        self.occupancy.bot_id = self.occupancy.bot_id or self.bot.user.id
+        self.occupancy.update(member, before, after)
 
-        if len(members := before.channel.members) == 1 and members[0].id == self.bot.user.id:
-            vc = before.channel.guild.voice_client
+        if member.id == self.bot.user.id and not after.channel:
+            if (state := self.states.evict(member.guild.id)) and state.channel:
+                self.announcements.forget(state.channel.id)
 
-            vc.cleanup()
-            await vc.disconnect()
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        for channel in guild.voice_channels + guild.stage_channels:
+            self.occupancy.untrack(channel.id)
+        if (state := self.states.evict(guild.id)) and state.channel:
+            self.announcements.forget(state.channel.id)
 
     async def cog_command_error(self, ctx, error):
         if type(error) == commands.CheckFailure:
@@ -694,13 +1447,22 @@ class CogOld(commands.Cog, name=name):
 
     async def query_tracks(self, ctx, mode, search):
         try:
-            tracks: wavelink.Search = await wavelink.Playable.search(search)
+            tracks: wavelink.Search = await self.search_cache.search(search)
             return tracks
         except Exception as exc:
             await ctx.reply(f"general error: {exc}")
             return False
 
-    @commands.command(aliases=["diff", "calc", "fe2"])
+    async def load_fe2(self, ctx):
+        # fe2 needs numpy, which only the calculator uses; without it the rest of the cog still loads.
+        try:
+            import fe2
+        except ImportError:
+            await ctx.reply("❌ The FE2 calculator needs numpy, which isn't installed.")
+            return None
+        return fe2
+
+    @commands.group(aliases=["diff", "calc", "fe2"], invoke_without_command=True)
     async def calculate_difficulty(
         self,
         ctx,
@@ -720,7 +1482,7 @@ class CogOld(commands.Cog, name=name):
             displayed_default=None,
         ),
         intensity_2x=param(
-            description="\n    {0-3} Boosts with 2x intensity boosting. 3 is only possible if intensity_1x is 0",
+            description="\n    {0-2} Boosts with 2x intensity boosting. Each one takes 2 of the 5 boost stacks",
             default=None,
             displayed_default=None,
         ),
@@ -735,7 +1497,12 @@ class CogOld(commands.Cog, name=name):
         The base minimum difficulty without boosts can be calucated with setting both intensity boosts to 0.
 
         2x Intensity Boost Gamepass users can be checked if the new minimum intensity is (base minimum difficulty + 1.0).
+
+        Use the `table` subcommand to see every boost and survivor combination at once.
         """
+        if not (fe2 := await self.load_fe2(ctx)):
+            return
+
         try:
             if not intensity_1x and (
                 not current_difficulty
@@ -756,91 +1523,43 @@ class CogOld(commands.Cog, name=name):
                 players_total = int(players_total)
 
             current_difficulty = float(current_difficulty)
-
-            base_difficulty = math.floor(current_difficulty)
-
-            match (base_difficulty):
-                case 1:
-                    difficulty = 0.4
-                case 2:
-                    difficulty = 0.5
-                case 3:
-                    difficulty = 0.6
-                case 4:
-                    difficulty = 0.65
-                case 5:
-                    difficulty = 1.5
-
-            if (
-                (2 * intensity_2x) + intensity_1x > 5
-                or intensity_2x < 0
-                or intensity_1x < 0
-            ):
-                raise Exception(
-                    "Amount of boosts are either grearer than maximum of 5 'stacks' or below minimum of 0 'stacks'."
-                )
-            elif intensity_2x > 3:
-                raise Exception("Amount of 2x intensity boosts are too high.")
-
-            intensity_1x = int(intensity_1x) * 0.5
-
-            if not player_percentage:
-                player_percentage = round(int(players_survived) / int(players_total), 2)
-
-            if player_percentage > 1:
-                raise Exception("Players survived greater than players total")
-
-            intensity_boost = int(intensity_2x) + intensity_1x
-
-            intensity_change = lambda x, y, z: x - y + z
-
-            min_diff = current_difficulty + intensity_change(
-                0, difficulty, intensity_boost
-            )
-            max_diff = current_difficulty + intensity_change(
-                1, difficulty, intensity_boost
-            )
-            prob_diff = current_difficulty + intensity_change(
-                player_percentage,
-                difficulty,
-                intensity_boost,
-            )
+            base_difficulty = fe2.base_of(current_difficulty)
+            boost = fe2.boost_index(intensity_2x, intensity_1x)
 
             if players_total:
-                value_of_one_player = 1 / players_total
-
-                staying_difference = base_difficulty - min_diff
-
-                required_players = round(
-                    math.ceil(staying_difference / value_of_one_player), 2
+                players_survived = int(players_survived)
+                if not 0 <= players_survived <= players_total:
+                    raise Exception("Players survived greater than players total")
+
+                outcomes, hold, raise_ = fe2.what_if(current_difficulty, players_total)
+                min_diff, max_diff = outcomes[boost, 0], outcomes[boost, -1]
+                prob_diff = outcomes[boost, players_survived]
+
+                required_players = (
+                    hold[boost]
+                    if hold[boost] >= 0
+                    else "IMPOSSIBLE | round will drop in difficulty"
                 )
-
-                if required_players < 0:
-                    required_players = 0
-                elif required_players > players_total:
-                    required_players = "IMPOSSIBLE | round will drop in difficulty"
-
                 if base_difficulty == 5:
                     required_players_up = "IMPOSSIBLE | max difficulty reached"
+                elif raise_[boost] >= 0:
+                    required_players_up = raise_[boost]
                 else:
-                    increasing_difference = (
-                        base_difficulty + 1 if base_difficulty < 5 else 0
-                    ) - min_diff
-
-                    required_players_up = round(
-                        math.ceil(increasing_difference / value_of_one_player), 2
-                    )
-
-                    if required_players_up < 0:
-                        required_players_up = 0
-                    elif required_players_up > players_total:
-                        required_players_up = "IMPOSSIBLE | round will stay at or drop below current difficulty"
+                    required_players_up = "IMPOSSIBLE | round will stay at or drop below current difficulty"
             else:
+                if player_percentage > 1:
+                    raise Exception("Players survived greater than players total")
+
+                min_diff, max_diff, prob_diff = (
+                    current_difficulty
+                    + fe2.intensity_change(base_difficulty, ratio, intensity_2x, intensity_1x)
+                    for ratio in (0, 1, player_percentage)
+                )
                 required_players = "IMPOSSIBLE | total amount of players not given"
                 required_players_up = "IMPOSSIBLE | total amount of players not given"
 
             return await ctx.reply(
-                f"*Minimum Difficulty: {min_diff}*\n*Maximum Difficulty: {max_diff}*\n**Probable Difficulty:** `{prob_diff}`\n__Players needed to survive to keep difficulty:__ `{required_players}`\n__Players needed to survive to increase difficulty:__ `{required_players_up}`"
+                f"*Minimum Difficulty: {min_diff:.2f}*\n*Maximum Difficulty: {max_diff:.2f}*\n**Probable Difficulty:** `{prob_diff:.2f}`\n__Players needed to survive to keep difficulty:__ `{required_players}`\n__Players needed to survive to increase difficulty:__ `{required_players_up}`"
             )
         except Exception as exc:
             traceback.print_exception(exc)
@@ -848,6 +1567,52 @@ class CogOld(commands.Cog, name=name):
                 f"One or more arguments are invalid. Please try again | {exc}"
             )
 
+    @calculate_difficulty.command(name="table", aliases=["whatif", "matrix", "all"])
+    async def difficulty_table(
+        self,
+        ctx,
+        current_difficulty: float = param(
+            description="\n    [1.0 - 5.99] The actual difficulty rating, listed above the boost button"
+        ),
+        players_total: int = param(
+            description="\n    [1-16] The total amount of players in the round",
+            default=16,
+        ),
+    ):
+        """\n    Shows the next FE2 difficulty for every boost and survivor combination.
+
+        Each row is one (2x, 1x) boost combination, with the players needed to survive to keep or increase the difficulty. The attached file lists the outcome for every number of survivors.
+        """
+        if not (fe2 := await self.load_fe2(ctx)):
+            return
+
+        try:
+            outcomes, hold, raise_ = fe2.what_if(current_difficulty, players_total)
+        except ValueError as exc:
+            return await ctx.reply(f"❌ {exc}")
+
+        needed = lambda players: "-" if players < 0 else str(players)
+        rows = [
+            f"{boost_2x:>2} {boost_1x:>2} {row[0]:>5.2f} {row[-1]:>5.2f} {needed(keep):>4} {needed(up):>4}"
+            for (boost_2x, boost_1x), row, keep, up in zip(fe2.BOOSTS, outcomes, hold, raise_)
+        ]
+        grid = [
+            "2x 1x " + " ".join(f"{survivors:>5}" for survivors in range(players_total + 1))
+        ] + [
+            f"{boost_2x:>2} {boost_1x:>2} " + " ".join(f"{outcome:>5.2f}" for outcome in row)
+            for (boost_2x, boost_1x), row in zip(fe2.BOOSTS, outcomes)
+        ]
+
+        await ctx.reply(
+            f"🔥 **Difficulty {current_difficulty} with {players_total} player(s)** (- = impossible)\n"
+            + "```\n2x 1x   min   max keep   up\n"
+            + "\n".join(rows)
+            + "\n```",
+            file=discord.File(
+                io.BytesIO("\n".join(grid).encode()), "fe2_outcomes_by_survivors.txt"
+            ),
+        )
+
 
 class Cog(commands.Cog, name=name):
     def __init__(self, bot):
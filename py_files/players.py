@@ -0,0 +1,530 @@
+import asyncio
+import discord
+import wavelink
+import random
+import sys
+import time
+import metrics
+
+
+class GuildState:
+    __slots__ = ("guild_id", "channel", "sticky", "announce")
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id: int = guild_id
+        self.channel: discord.abc.Messageable | None = None
+        self.sticky: bool = False
+        self.announce: bool = True
+
+
+class GuildStates(dict):
+    """Per-guild player state, created when the bot joins and evicted on disconnect.
+
+    Read paths use `get`, so commands in guilds without a player leave no state behind."""
+
+    def __missing__(self, guild_id: int) -> GuildState:
+        state = self[guild_id] = GuildState(guild_id)
+        return state
+
+    def evict(self, guild_id: int) -> GuildState | None:
+        return self.pop(guild_id, None)
+
+
+class VoiceOccupancy:
+    """Who is in each voice channel the bot is playing in.
+
+    Kept up to date from voice state deltas; events for any other channel are a
+    single dict miss. Membership is kept as id sets so repeated or reordered
+    events cannot push the counts out of range."""
+
+    __slots__ = ("channels", "bot_id")
+
+    def __init__(self, bot_id: int | None = None) -> None:
+        self.channels: dict[int, tuple[set[int], set[int]]] = {}
+        self.bot_id = bot_id
+
+    def track(
+        self, channel: discord.VoiceChannel | discord.StageChannel
+    ) -> tuple[set[int], set[int]]:
+        members = channel.members
+        occupants = self.channels[channel.id] = (
+            {member.id for member in members},
+            {member.id for member in members if not member.bot},
+        )
+        return occupants
+
+    def untrack(self, channel_id: int) -> None:
+        self.channels.pop(channel_id, None)
+
+    def members(self, channel: discord.VoiceChannel | discord.StageChannel) -> int:
+        return len((self.channels.get(channel.id) or self.track(channel))[0])
+
+    def humans(self, channel: discord.VoiceChannel | discord.StageChannel) -> int:
+        return len((self.channels.get(channel.id) or self.track(channel))[1])
+
+    def update(
+        self,
+        member: discord.Member,
+        before: discord.VoiceState,
+        after: discord.VoiceState,
+    ) -> None:
+        before_id = before.channel.id if before.channel else None
+        after_id = after.channel.id if after.channel else None
+        if before_id == after_id:
+            return
+
+        if member.id == self.bot_id:
+            if before_id:
+                self.untrack(before_id)
+            if after.channel:
+                self.track(after.channel)
+            return
+
+        if occupants := self.channels.get(before_id):
+            occupants[0].discard(member.id)
+            occupants[1].discard(member.id)
+        if occupants := self.channels.get(after_id):
+            occupants[0].add(member.id)
+            if not member.bot:
+                occupants[1].add(member.id)
+
+
+class CompactTrack:
+    """A queued track kept as its encoded string plus the fields the queue displays."""
+
+    __slots__ = ("encoded", "title", "author", "length", "identifier", "requester")
+
+    def __init__(
+        self,
+        encoded: str,
+        title: str,
+        author: str,
+        length: int,
+        identifier: str,
+        requester: int | None = None,
+    ) -> None:
+        self.encoded = encoded
+        self.title = title
+        self.author = author
+        self.length = length
+        self.identifier = identifier
+        self.requester = requester
+
+    def __str__(self) -> str:
+        return self.title
+
+    def __repr__(self) -> str:
+        return f"CompactTrack(title={self.title}, identifier={self.identifier})"
+
+    @classmethod
+    def from_playable(
+        self, track: wavelink.Playable, requester: int | None = None
+    ) -> "CompactTrack":
+        return self(
+            track.encoded,
+            track.title,
+            track.author,
+            track.length,
+            track.identifier,
+            requester,
+        )
+
+    @classmethod
+    def from_payload(self, data: dict, requester: int | None = None) -> "CompactTrack":
+        info = data["info"]
+        return self(
+            data["encoded"],
+            info["title"],
+            info["author"],
+            info["length"],
+            info["identifier"],
+            requester,
+        )
+
+    async def materialize(self, node: wavelink.Node) -> wavelink.Playable:
+        data = await node.send(
+            "GET", path="v4/decodetrack", params={"encodedTrack": self.encoded}
+        )
+        return wavelink.Playable(data)
+
+
+def requester_of(track: wavelink.Playable | CompactTrack) -> int | None:
+    if isinstance(track, CompactTrack):
+        return track.requester
+    return getattr(track.extras, "requester", None)
+
+
+def with_requester(track: wavelink.Playable, requester: int | None) -> wavelink.Playable:
+    # A copy, since search results are shared between guilds through the search cache.
+    track = wavelink.Playable(track.raw_data)
+    if requester is not None:
+        track.extras = {"requester": requester}
+    return track
+
+
+async def decode_tracks(node: wavelink.Node, encoded: list[str]) -> list[dict]:
+    if not encoded:
+        return []
+    return await node.send("POST", path="v4/decodetracks", data=encoded)
+
+
+def deep_sizeof(obj, seen: set | None = None) -> int:
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_sizeof(key, seen) + deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        return size
+
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+
+    return size
+
+
+class TrackList:
+    """Queued tracks kept in blocks, with a running total of their lengths.
+
+    A Fenwick tree over the block sizes finds any position in O(log n), so
+    indexing, inserting, deleting and moving anywhere in a long queue only
+    shifts the items of one bounded block instead of the whole list."""
+
+    __slots__ = ("blocks", "tree", "size", "total_length")
+
+    # Blocks are split once they grow past twice this size.
+    BLOCK_SIZE = 256
+
+    def __init__(self, tracks=()) -> None:
+        self.rebuild(list(tracks))
+
+    def rebuild(self, tracks: list) -> None:
+        self.blocks: list[list] = [
+            tracks[start : start + self.BLOCK_SIZE]
+            for start in range(0, len(tracks), self.BLOCK_SIZE)
+        ]
+        self.size: int = len(tracks)
+        self.total_length: int = sum(track.length for track in tracks)
+        self.reindex()
+
+    def reindex(self) -> None:
+        tree = [0] * (len(self.blocks) + 1)
+        for position, block in enumerate(self.blocks, 1):
+            tree[position] += len(block)
+            if (parent := position + (position & -position)) < len(tree):
+                tree[parent] += tree[position]
+        self.tree: list[int] = tree
+
+    def resize(self, block_index: int, delta: int) -> None:
+        position = block_index + 1
+        while position < len(self.tree):
+            self.tree[position] += delta
+            position += position & -position
+
+    def locate(self, index: int) -> tuple[int, int]:
+        """The block and offset holding `index`, which may be negative."""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("queue index out of range")
+
+        block_index, step = 0, 1 << len(self.blocks).bit_length()
+        while step:
+            if (
+                position := block_index + step
+            ) < len(self.tree) and self.tree[position] <= index:
+                block_index = position
+                index -= self.tree[position]
+            step >>= 1
+        return block_index, index
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __reversed__(self):
+        for block in reversed(self.blocks):
+            yield from reversed(block)
+
+    def __contains__(self, track) -> bool:
+        return any(track in block for block in self.blocks)
+
+    def __repr__(self) -> str:
+        return f"TrackList({list(self)!r})"
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            block_index, offset = self.locate(index)
+            return self.blocks[block_index][offset]
+
+        start, stop, step = index.indices(self.size)
+        if step != 1:
+            return list(self)[index]
+
+        tracks = []
+        if start < stop:
+            block_index, offset = self.locate(start)
+            while len(tracks) < stop - start:
+                block = self.blocks[block_index]
+                tracks += block[offset : offset + stop - start - len(tracks)]
+                block_index, offset = block_index + 1, 0
+        return tracks
+
+    def __setitem__(self, index, value) -> None:
+        if isinstance(index, slice):
+            tracks = list(self)
+            tracks[index] = value
+            return self.rebuild(tracks)
+
+        block_index, offset = self.locate(index)
+        block = self.blocks[block_index]
+        self.total_length += value.length - block[offset].length
+        block[offset] = value
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            tracks = list(self)
+            del tracks[index]
+            return self.rebuild(tracks)
+        self.pop(index)
+
+    def __iadd__(self, tracks):
+        self.extend(tracks)
+        return self
+
+    def copy(self) -> "TrackList":
+        return TrackList(self)
+
+    def index(self, track) -> int:
+        start = 0
+        for block in self.blocks:
+            if track in block:
+                return start + block.index(track)
+            start += len(block)
+        raise ValueError(f"{track!r} is not in the queue")
+
+    def append(self, track) -> None:
+        self.insert(self.size, track)
+
+    def extend(self, tracks) -> None:
+        tracks = list(tracks)
+        if not tracks:
+            return
+
+        self.total_length += sum(track.length for track in tracks)
+        self.size += len(tracks)
+        if self.blocks and (room := self.BLOCK_SIZE - len(self.blocks[-1])) > 0:
+            self.blocks[-1] += tracks[:room]
+            tracks = tracks[room:]
+        self.blocks += [
+            tracks[start : start + self.BLOCK_SIZE]
+            for start in range(0, len(tracks), self.BLOCK_SIZE)
+        ]
+        self.reindex()
+
+    def insert(self, index: int, track) -> None:
+        if index < 0:
+            index = max(index + self.size, 0)
+        if index >= self.size:
+            if not self.blocks or len(self.blocks[-1]) >= 2 * self.BLOCK_SIZE:
+                self.blocks.append([])
+                self.reindex()
+            block_index, offset = len(self.blocks) - 1, len(self.blocks[-1])
+        else:
+            block_index, offset = self.locate(index)
+
+        block = self.blocks[block_index]
+        block.insert(offset, track)
+        self.size += 1
+        self.total_length += track.length
+
+        if len(block) > 2 * self.BLOCK_SIZE:
+            self.blocks[block_index : block_index + 1] = [
+                block[: self.BLOCK_SIZE],
+                block[self.BLOCK_SIZE :],
+            ]
+            self.reindex()
+        else:
+            self.resize(block_index, 1)
+
+    def pop(self, index: int = -1):
+        block_index, offset = self.locate(index)
+        block = self.blocks[block_index]
+        track = block.pop(offset)
+        self.size -= 1
+        self.total_length -= track.length
+
+        if block:
+            self.resize(block_index, -1)
+        else:
+            del self.blocks[block_index]
+            self.reindex()
+        return track
+
+    def remove(self, track) -> None:
+        self.pop(self.index(track))
+
+    def clear(self) -> None:
+        self.rebuild([])
+
+    def move(self, source: int, destination: int) -> None:
+        self.insert(destination, self.pop(source))
+
+    def shuffle(self) -> None:
+        tracks = list(self)
+        random.shuffle(tracks)
+        self.blocks = [
+            tracks[start : start + self.BLOCK_SIZE]
+            for start in range(0, len(tracks), self.BLOCK_SIZE)
+        ]
+        self.reindex()
+
+    def remove_where(self, predicate) -> list:
+        """Removes every track matching `predicate` in one pass, returning them in order."""
+        kept, removed = [], []
+        for track in self:
+            (removed if predicate(track) else kept).append(track)
+
+        if removed:
+            self.rebuild(kept)
+        return removed
+
+    def remove_range(self, start: int, stop: int) -> list:
+        removed = self[start:stop]
+        if removed:
+            del self[start:stop]
+        return removed
+
+    def dedupe(self) -> list:
+        """Drops every track whose identifier appeared earlier in the queue."""
+        seen = set()
+        return self.remove_where(
+            lambda track: track.identifier in seen or seen.add(track.identifier)
+        )
+
+
+class Queue(wavelink.Queue):
+    def __init__(self, *, history: bool = True) -> None:
+        super().__init__(history=history)
+        self._items: TrackList = TrackList()
+        self._history: Queue | None = Queue(history=False) if history else None
+
+    @staticmethod
+    def _check_compatibility(item: object) -> bool:
+        if not isinstance(item, (wavelink.Playable, CompactTrack)):
+            raise TypeError("This queue is restricted to Playable and CompactTrack objects.")
+        return True
+
+    @property
+    def total_length(self) -> int:
+        return self._items.total_length
+
+    def pop(self, index: int = -1) -> wavelink.Playable | CompactTrack:
+        return self._items.pop(index)
+
+    def move(self, source: int, destination: int) -> None:
+        self._items.move(source, destination)
+
+    def shuffle(self) -> None:
+        self._items.shuffle()
+
+    def remove_where(self, predicate) -> list:
+        return self._items.remove_where(predicate)
+
+    def remove_range(self, start: int, stop: int) -> list:
+        return self._items.remove_range(start, stop)
+
+    def dedupe(self) -> list:
+        return self._items.dedupe()
+
+
+class Player(wavelink.Player):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.queue: Queue = Queue()
+
+        self.prefetched_entry = None
+        self.prefetched: wavelink.Playable | None = None
+        self.ended_at: float | None = None
+        self.last_gap: float | None = None
+        self.average_gap: float | None = None
+        self.idle_reason: str | None = None
+        self.idle_since: float | None = None
+        # Held from dequeuing an entry until it is playing, see `play_next`.
+        self.starting = asyncio.Lock()
+
+    async def resolve(self, entry: wavelink.Playable | CompactTrack) -> wavelink.Playable:
+        if isinstance(entry, CompactTrack):
+            return with_requester(await entry.materialize(self.node), entry.requester)
+        return entry
+
+    async def prefetch(self) -> wavelink.Playable | None:
+        """Resolves the entry that will play next so the track end handler only has to send it."""
+        if self.queue.mode is wavelink.QueueMode.loop or not self.queue:
+            self.prefetched_entry = self.prefetched = None
+            return None
+
+        entry = self.queue.peek(0)
+        if entry is not self.prefetched_entry:
+            self.prefetched = await self.resolve(entry)
+            self.prefetched_entry = entry
+        return self.prefetched
+
+    async def play(self, track, **kwargs) -> wavelink.Playable:
+        entry = track
+        if entry is self.prefetched_entry and self.prefetched:
+            track = self.prefetched
+        else:
+            track = await self.resolve(entry)
+        self.prefetched_entry = self.prefetched = None
+
+        if self.queue._loaded is entry:
+            self.queue._loaded = track
+
+        track = await super().play(track, **kwargs)
+
+        history = self.queue.history
+        if history and history._items and history._items[-1] is track:
+            history._items[-1] = CompactTrack.from_playable(track, requester_of(entry))
+
+        return track
+
+    async def play_next(self) -> wavelink.Playable | None:
+        """Dequeues and starts the next entry, unless a track is already playing.
+
+        Resolving an entry leaves `current` unset for a moment, so every start goes
+        through this lock; otherwise a second caller could dequeue during that gap."""
+        async with self.starting:
+            if self.current:
+                return None
+            return await self.play(self.queue.get())
+
+    def record_gap(self) -> None:
+        if self.ended_at is None:
+            return
+
+        self.last_gap = (time.perf_counter() - self.ended_at) * 1000
+        self.ended_at = None
+        metrics.track_gap_seconds.observe(self.last_gap / 1000)
+        self.average_gap = (
+            self.last_gap
+            if self.average_gap is None
+            else self.average_gap * 0.8 + self.last_gap * 0.2
+        )
@@ -0,0 +1,172 @@
+import asyncio
+import discord
+import json
+import os
+import re
+import time
+from issutilities import DIRS
+
+
+class PrefixMatcher:
+    """Every prefix of one guild compiled into a single anchored pattern.
+
+    Messages whose first character cannot start any prefix are rejected without
+    touching the pattern at all."""
+
+    __slots__ = ("prefixes", "first_chars", "pattern")
+
+    def __init__(self, prefixes: list[str], case_insensitive: bool = False) -> None:
+        # Longest first, so "dj-" is tried before a shorter prefix it starts with.
+        self.prefixes = tuple(
+            sorted({prefix for prefix in prefixes if prefix}, key=len, reverse=True)
+        )
+        first_chars = {prefix[0] for prefix in self.prefixes}
+        if case_insensitive:
+            first_chars |= {char.lower() for char in first_chars}
+            first_chars |= {char.upper() for char in first_chars}
+        self.first_chars = frozenset(first_chars)
+        self.pattern = re.compile(
+            "|".join(map(re.escape, self.prefixes)),
+            re.IGNORECASE if case_insensitive else 0,
+        )
+
+    def match(self, content: str) -> str | None:
+        if content[:1] not in self.first_chars:
+            return None
+        if found := self.pattern.match(content):
+            return found.group()
+        return None
+
+
+class PrefixResolver:
+    """`command_prefix` for the bot, with per-guild prefixes kept in their own JSON file.
+
+    Returns the prefix as it was typed, so discord.py only has one string to skip.
+    Shard processes share the file, so a change is merged into what is on disk
+    under a lock instead of overwriting it with this process's copy."""
+
+    def __init__(
+        self,
+        prefixes: list[str],
+        mention: bool = False,
+        case_insensitive: bool = False,
+        name: str = "guild_prefixes",
+        max_prefixes: int = 5,
+        max_length: int = 16,
+    ) -> None:
+        self.defaults = [prefix for prefix in prefixes if prefix]
+        self.mention = mention
+        self.case_insensitive = case_insensitive
+        self.path = f"{DIRS.JSON}/{name}.json"
+        self.max_prefixes = max_prefixes
+        self.max_length = max_length
+
+        self.bot_id: int | None = None
+        self.custom: dict[int, list[str]] = self.load()
+        self.matchers: dict[int | None, PrefixMatcher] = {}
+
+    def load(self) -> dict[int, list[str]]:
+        try:
+            with open(self.path) as fp:
+                return {
+                    int(guild_id): prefixes
+                    for guild_id, prefixes in json.load(fp).items()
+                }
+        except (OSError, ValueError):
+            return {}
+
+    def lock(self, timeout: float = 10.0) -> None:
+        lock_path = f"{self.path}.lock"
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return
+            except FileExistsError:
+                if time.monotonic() > deadline:
+                    # Left behind by a process that died while holding it.
+                    os.remove(lock_path)
+                    deadline = time.monotonic() + timeout
+                    continue
+                time.sleep(0.05)
+
+    def unlock(self) -> None:
+        try:
+            os.remove(f"{self.path}.lock")
+        except FileNotFoundError:
+            pass
+
+    def write(self, guild_id: int, prefixes: list[str] | None) -> dict[int, list[str]]:
+        self.lock()
+        try:
+            custom = self.load()
+            if prefixes:
+                custom[guild_id] = prefixes
+            else:
+                custom.pop(guild_id, None)
+
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as fp:
+                json.dump(
+                    {str(guild_id): prefixes for guild_id, prefixes in custom.items()},
+                    fp,
+                    indent=2,
+                )
+            os.replace(temp_path, self.path)
+            return custom
+        finally:
+            self.unlock()
+
+    def prefixes_for(self, guild_id: int | None) -> list[str]:
+        return self.custom.get(guild_id, self.defaults)
+
+    def matcher(self, guild_id: int | None) -> PrefixMatcher:
+        # Guilds without their own prefixes all share the default matcher.
+        key = guild_id if guild_id in self.custom else None
+        if not (matcher := self.matchers.get(key)):
+            mentions = (
+                [f"<@{self.bot_id}> ", f"<@!{self.bot_id}> "]
+                if self.mention and self.bot_id
+                else []
+            )
+            matcher = self.matchers[key] = PrefixMatcher(
+                mentions + self.prefixes_for(key), self.case_insensitive
+            )
+        return matcher
+
+    def match(self, bot, message: discord.Message) -> str | None:
+        if self.bot_id is None and bot.user:
+            self.bot_id = bot.user.id
+            self.matchers.clear()
+        return self.matcher(message.guild.id if message.guild else None).match(
+            message.content
+        )
+
+    def __call__(self, bot, message: discord.Message) -> str | list[str]:
+        return self.match(bot, message) or []
+
+    def validate(self, prefixes: list[str]) -> str | None:
+        if len(prefixes) > self.max_prefixes:
+            return f"A server can have at most {self.max_prefixes} prefixes."
+        for prefix in prefixes:
+            if len(prefix) > self.max_length:
+                return f"Prefixes can be at most {self.max_length} characters long."
+            if any(char.isspace() for char in prefix) or prefix.startswith("<@"):
+                return (
+                    f"`{discord.utils.escape_markdown(prefix)}` can't be used as a prefix."
+                )
+        return None
+
+    async def set(self, guild_id: int, prefixes: list[str] | None) -> None:
+        prefixes = list(dict.fromkeys(prefixes)) if prefixes else None
+        if prefixes:
+            self.custom[guild_id] = prefixes
+        else:
+            self.custom.pop(guild_id, None)
+        self.matchers.pop(guild_id, None)
+
+        # Picks up whatever the other shard processes saved in the meantime.
+        self.custom = await asyncio.to_thread(self.write, guild_id, prefixes)
+        self.matchers = {
+            key: matcher for key, matcher in self.matchers.items() if key is None
+        }
@@ -0,0 +1,73 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+import wavelink
+from issutilities import DIRS
+from players import GuildState, Player, requester_of
+
+
+class SnapshotStore:
+    """Per-guild player snapshots kept in one gzipped JSON file.
+
+    Tracks are stored as their Lavalink encoded strings only, so a restore is a
+    single bulk decode instead of a search per track."""
+
+    def __init__(self, name: str = "queue_snapshot", max_age: float = 24 * 60 * 60) -> None:
+        self.path = f"{DIRS.JSON}/{name}.json.gz"
+        self.max_age = max_age
+
+    def load(self) -> dict[int, dict]:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as fp:
+                records = json.load(fp)
+        except (OSError, EOFError, ValueError):
+            return {}
+
+        oldest = time.time() - self.max_age
+        return {
+            record["guild"]: record
+            for record in records
+            if record.get("saved_at", 0) >= oldest
+        }
+
+    def write(self, records: list[dict]) -> None:
+        temp_path = f"{self.path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=5) as fp:
+            json.dump(records, fp, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+    async def save(self, records: list[dict]) -> None:
+        oldest = time.time() - self.max_age
+        await asyncio.to_thread(
+            self.write, [record for record in records if record["saved_at"] >= oldest]
+        )
+
+    @classmethod
+    def capture(self, vc: Player, state: GuildState | None) -> dict | None:
+        if not vc.guild or not vc.channel or not (vc.current or vc.queue):
+            return None
+
+        return {
+            "guild": vc.guild.id,
+            "voice_channel": vc.channel.id,
+            "announce_channel": state.channel.id if state and state.channel else None,
+            "sticky": state.sticky if state else False,
+            "announce": state.announce if state else True,
+            "mode": vc.queue.mode.value,
+            "current": vc.current.encoded if vc.current else None,
+            "current_requester": requester_of(vc.current) if vc.current else None,
+            "position": vc.position if vc.current else 0,
+            "paused": vc.paused,
+            "queue": [entry.encoded for entry in vc.queue],
+            "requesters": [requester_of(entry) for entry in vc.queue],
+            "saved_at": time.time(),
+        }
+
+    @classmethod
+    def queue_mode(self, record: dict) -> wavelink.QueueMode:
+        try:
+            return wavelink.QueueMode(record.get("mode", 0))
+        except ValueError:
+            return wavelink.QueueMode.normal